@@ -1,19 +1,87 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, request, jsonify
 import cv2
 import numpy as np
-from deepface import DeepFace
-import mediapipe as mp
 import base64
+import json
+import os
+import threading
+import time
+import uuid
+import queue
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
+from flask_sock import Sock, ConnectionClosed
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram,
+                               generate_latest, multiprocess)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+sock = Sock(app)
 
-# Initialize MediaPipe
-mp_face_mesh = mp.solutions.face_mesh
-mp_holistic = mp.solutions.holistic
-face_mesh = mp_face_mesh.FaceMesh(max_num_faces=1, refine_landmarks=True)
-holistic = mp_holistic.Holistic()
+# Prometheus instrumentation, scraped from /metrics. Under gunicorn set
+# PROMETHEUS_MULTIPROC_DIR so every worker's samples are aggregated.
+STAGE_SECONDS = Histogram(
+    'analyze_stage_seconds', 'Time spent in each frame analysis stage', ['stage'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+REQUESTS_IN_FLIGHT = Gauge(
+    'analyze_requests_in_flight', 'Requests (or open streams) currently being served', ['endpoint'],
+    multiprocess_mode='livesum')
+
+# Emotion backend: "deepface" (default) or "openvino" (intel/emotions-recognition-retail-0003)
+EMOTION_BACKEND = os.environ.get("EMOTION_BACKEND", "deepface").lower()
+EMOTION_MODEL_DIR = os.environ.get("EMOTION_MODEL_DIR", os.path.join("intel", "emotions-recognition-retail-0003"))
+
+# OpenVINO model labels, mapped onto the names DeepFace reports so clients see one vocabulary
+OV_EMOTIONS = ["neutral", "happy", "sad", "surprise", "angry"]
+
+# Models are loaded (and warmed up on a dummy frame) by load_models(), in a
+# background thread at startup unless WARMUP_ON_START=0. /healthz answers as
+# soon as the process is up, /readyz only once the models are ready.
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "1") == "1"
+
+# FaceMesh/Pose pairs, i.e. how many frames are analyzed at once. Independent of
+# the server's thread count: most threads sit waiting on open /stream sockets,
+# and requests beyond the pool size queue for a pair.
+MEDIAPIPE_POOL_SIZE = int(os.environ.get("MEDIAPIPE_POOL_SIZE", os.cpu_count() or 2))
+
+# Upper bound on frames accepted by /analyze_batch in one request
+MAX_BATCH_FRAMES = int(os.environ.get("MAX_BATCH_FRAMES", 64))
+# Size limits: one encoded frame, and any request body (a full batch of data URLs).
+# Bigger requests are rejected with 413 before anything is allocated for them.
+MAX_FRAME_BYTES = int(os.environ.get("MAX_FRAME_BYTES", 8 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_REQUEST_BYTES", 64 * 1024 * 1024))
+
+# Streaming sessions: rolling window length (frames), idle timeout (seconds) and cap
+SESSION_WINDOW = int(os.environ.get("SESSION_WINDOW", 150))
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 300))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 500))
+
+# Every open /stream socket holds a server thread, so at most MAX_STREAMS are
+# accepted and the remaining threads stay free for /analyze and the probes.
+# A socket that sends nothing for STREAM_IDLE_TIMEOUT seconds is closed.
+SERVER_THREADS = int(os.environ.get("THREADS", 32))
+MAX_STREAMS = int(os.environ.get("MAX_STREAMS", max(1, SERVER_THREADS - 4)))
+STREAM_IDLE_TIMEOUT = float(os.environ.get("STREAM_IDLE_TIMEOUT", 30))
+
+# Within a session, run each analyzer only every N frames and reuse its last result in between
+ANALYZER_INTERVALS = {
+    'face_mesh': max(1, int(os.environ.get("FACE_MESH_EVERY", 1))),
+    'pose': max(1, int(os.environ.get("POSE_EVERY", 5))),
+    'emotion': max(1, int(os.environ.get("EMOTION_EVERY", 10))),
+}
+
+# Per-session near-duplicate frame cache: entries, seconds to live, and the max
+# number of differing perceptual-hash bits (out of 512) still counted as a repeat
+FRAME_CACHE_SIZE = int(os.environ.get("FRAME_CACHE_SIZE", 32))
+FRAME_CACHE_TTL = float(os.environ.get("FRAME_CACHE_TTL", 5))
+FRAME_CACHE_THRESHOLD = int(os.environ.get("FRAME_CACHE_THRESHOLD", 4))
+FRAME_HASH_SIZE = 16
+
+BLINK_EAR_THRESHOLD = 0.21
+# Summed std-dev of the normalized hand position over the window
+FIDGET_THRESHOLD = 0.05
 
 # Landmark indices
 LEFT_EYE = [33, 160, 158, 133, 153, 144]
@@ -22,6 +90,105 @@ UPPER_LIP = 13
 LOWER_LIP = 14
 SHOULDER_LEFT = 11
 SHOULDER_RIGHT = 12
+# Pose wrist, pinky, index and thumb points: enough for hand-on-face and fidgeting
+# without Holistic's separate hand and face landmark models
+POSE_HANDS = [15, 16, 17, 18, 19, 20, 21, 22]
+POSE_VISIBILITY = 0.5
+# Extra context around the FaceMesh box for the emotion crop (fraction of box size)
+FACE_CROP_MARGIN = 0.15
+
+class GraphPool:
+    # MediaPipe graphs aren't safe to share between threads, so each request
+    # checks out its own pair and returns it afterwards. A pair serves frames
+    # from unrelated clients in turn, so the graphs run in static image mode:
+    # no landmark tracking carried over from one client's frame to the next.
+
+    def __init__(self, size):
+        import mediapipe as mp
+
+        self.graphs = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self.graphs.put((
+                mp.solutions.face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1, refine_landmarks=True),
+                mp.solutions.pose.Pose(static_image_mode=True),
+            ))
+
+    @contextmanager
+    def checkout(self):
+        graphs = self.graphs.get()
+        try:
+            yield graphs
+        finally:
+            self.graphs.put(graphs)
+
+    def warm_up(self, frame):
+        # Push one frame through every graph so the first real request doesn't pay for graph start-up
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        graphs = [self.graphs.get() for _ in range(self.graphs.maxsize)]
+        try:
+            for face_mesh, pose in graphs:
+                face_mesh.process(rgb)
+                pose.process(rgb)
+        finally:
+            for pair in graphs:
+                self.graphs.put(pair)
+
+graph_pool = None
+DeepFace = None
+emotion_compiled_model = None
+emotion_output_layer = None
+# compiled_model(...) reuses one internal request, so each thread gets its own
+emotion_requests = threading.local()
+
+models_lock = threading.Lock()
+models_ready = threading.Event()
+models_error = None
+
+def load_models():
+    # Heavy imports and model construction, done once per worker. Every analysis
+    # path calls this first; after start-up it returns immediately.
+    global graph_pool, DeepFace, emotion_compiled_model, emotion_output_layer
+    if models_ready.is_set():
+        return
+    with models_lock:
+        if models_ready.is_set():
+            return
+        dummy = np.zeros((480, 640, 3), np.uint8)
+
+        if EMOTION_BACKEND == "openvino":
+            from openvino.runtime import PartialShape
+            import ov_models
+
+            # Load model with a dynamic batch so /analyze_batch can run all faces in one inference
+            # (precision, device, performance hints and the compiled-model cache come from ov_models)
+            emotion_model = ov_models.read_model(EMOTION_MODEL_DIR)
+            emotion_model.reshape({emotion_model.input(0): PartialShape([-1, 3, 64, 64])})
+            emotion_compiled_model = ov_models.compile_model(emotion_model)
+            emotion_output_layer = emotion_compiled_model.output(0)
+            emotion_compiled_model.create_infer_request().infer([np.zeros((1, 3, 64, 64), np.float32)])
+        else:
+            # Only the DeepFace backend pays for TensorFlow
+            from deepface import DeepFace as deepface
+            deepface.analyze(dummy[:64, :64], actions=['emotion'], detector_backend='skip', enforce_detection=False)
+            DeepFace = deepface
+
+        pool = GraphPool(MEDIAPIPE_POOL_SIZE)
+        pool.warm_up(dummy)
+        graph_pool = pool
+        models_ready.set()
+
+def warm_up_in_background():
+    global models_error
+    try:
+        start = time.monotonic()
+        load_models()
+        print(f"Models ready in {time.monotonic() - start:.1f}s")
+    except Exception as e:
+        models_error = str(e)
+        print(f"Model loading error: {str(e)}")
+
+if WARMUP_ON_START:
+    threading.Thread(target=warm_up_in_background, daemon=True).start()
 
 def calculate_eye_aspect_ratio(eye):
     vert1 = np.linalg.norm(np.array(eye[1]) - np.array(eye[5]))
@@ -29,10 +196,8 @@ def calculate_eye_aspect_ratio(eye):
     horiz = np.linalg.norm(np.array(eye[0]) - np.array(eye[3]))
     return (vert1 + vert2) / (2.0 * horiz)
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
-    # Initialize metrics with default values
-    metrics = {
+def default_metrics():
+    return {
         'blink_count': 0,
         'lip_biting': False,
         'gaze_direction': "Center",
@@ -45,124 +210,619 @@ def analyze():
         'feedback': "Analysis in progress"
     }
 
-    try:
-        # Get frame data from request
-        frame_data = request.json.get('frame')
-        if not frame_data:
-            return jsonify(metrics)
-            
-        # Decode base64 image
+# Content types accepted as a raw encoded image body on /analyze
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+def decode_frame(frame_data):
+    # Decode base64 data URL into a BGR image (None if it can't be decoded)
+    with STAGE_SECONDS.labels('decode').time():
         header, encoded = frame_data.split(",", 1)
         img_bytes = base64.b64decode(encoded)
         nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            return jsonify(metrics)
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, _ = frame.shape
+def decode_image_bytes(img_bytes):
+    # Decode an encoded image buffer (bytes, bytearray or uint8 array) without copying it first
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    if nparr.size == 0:
+        return None
+    with STAGE_SECONDS.labels('decode').time():
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-        # Emotion detection
-        try:
-            result = DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
-            metrics['emotion'] = result[0]['dominant_emotion']
-        except Exception as e:
-            print(f"Emotion detection error: {str(e)}")
-
-        # Face mesh analysis
-        results_face = face_mesh.process(rgb)
-        results_holistic = holistic.process(rgb)
-
-        # Initialize analysis variables
-        blink_detected = False
-        lip_biting = False
-        gaze_dir = "Center"
-        hand_on_face = False
-        fidgeting = False
-        shrugging = False
-        eye_contact_frames = 0
-        total_frames = 1  # Avoid division by zero
-
-        if results_face.multi_face_landmarks:
-            landmarks = results_face.multi_face_landmarks[0].landmark
-
-            # Blink detection
-            left_eye = [(landmarks[i].x * w, landmarks[i].y * h) for i in LEFT_EYE]
-            right_eye = [(landmarks[i].x * w, landmarks[i].y * h) for i in RIGHT_EYE]
-            left_ear = calculate_eye_aspect_ratio(left_eye)
-            right_ear = calculate_eye_aspect_ratio(right_eye)
-            avg_ear = (left_ear + right_ear) / 2.0
-
-            if avg_ear < 0.21:
-                blink_detected = True
-                metrics['blink_count'] = 1
-
-            # Lip biting detection (FIXED)
-            lip_dist = abs((landmarks[UPPER_LIP].y - landmarks[LOWER_LIP].y) * h)
-            lip_biting = lip_dist < 5
-            metrics['lip_biting'] = lip_biting
-
-            # Gaze direction
-            eye_center_x = (landmarks[33].x + landmarks[263].x) / 2
-            face_center_x = landmarks[1].x
-            if eye_center_x - face_center_x > 0.03:
-                gaze_dir = "Right"
-            elif eye_center_x - face_center_x < -0.03:
-                gaze_dir = "Left"
-            else:
-                eye_contact_frames = 1
+def read_raw_body():
+    # Read the request body straight into a numpy buffer; falls back to
+    # get_data() when the client didn't send a Content-Length (chunked upload)
+    length = request.content_length
+    if length is None:
+        data = request.get_data(cache=False)
+        if len(data) > MAX_FRAME_BYTES:
+            abort(413)
+        return np.frombuffer(data, np.uint8)
+    if length > MAX_FRAME_BYTES:
+        abort(413)
+    buf = np.empty(length, np.uint8)
+    view = memoryview(buf)
+    read = 0
+    while read < length:
+        n = request.stream.readinto(view[read:])
+        if not n:
+            break
+        read += n
+    return buf[:read]
+
+def read_request_frame():
+    # Returns the decoded frame for /analyze, or None if the request has none.
+    # Accepts a raw image body, a multipart 'frame' file, or the legacy JSON data URL.
+    if request.mimetype in RAW_IMAGE_TYPES:
+        return decode_image_bytes(read_raw_body())
+    if request.mimetype == 'multipart/form-data':
+        file = request.files.get('frame')
+        return decode_image_bytes(file.read()) if file is not None else None
+    frame_data = request.json.get('frame')
+    if not frame_data:
+        return None
+    return decode_frame(frame_data)
 
-            metrics['gaze_direction'] = gaze_dir
+def crop_face(frame, face_box):
+    # Face crop from the FaceMesh landmark box, padded a little so the whole face is in view
+    x0, y0, x1, y1 = face_box
+    h, w = frame.shape[:2]
+    pad_x, pad_y = int((x1 - x0) * FACE_CROP_MARGIN), int((y1 - y0) * FACE_CROP_MARGIN)
+    x0, y0 = max(0, x0 - pad_x), max(0, y0 - pad_y)
+    x1, y1 = min(w, x1 + pad_x), min(h, y1 + pad_y)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return frame[y0:y1, x0:x1]
 
-        # Holistic analysis (hands and pose)
-        if results_holistic:
+def detect_emotions(frames, face_boxes):
+    # Dominant emotion per frame, classified on the face crop only
+    # (None where there is no face or detection failed)
+    crops = [crop_face(frame, box) if frame is not None and box is not None else None
+             for frame, box in zip(frames, face_boxes)]
+    if all(crop is None for crop in crops):
+        return [None] * len(frames)
+
+    # Only timed when a model actually runs, so skipped frames don't dilute the histogram
+    with STAGE_SECONDS.labels('emotion').time():
+        return classify_crops(crops)
+
+def classify_crops(crops):
+    if EMOTION_BACKEND != "openvino":
+        return [detect_emotion(crop) if crop is not None else None for crop in crops]
+
+    emotions = [None] * len(crops)
+    try:
+        indices = [i for i, crop in enumerate(crops) if crop is not None]
+        if indices:
+            # HWC to CHW, all faces in one batch
+            batch = np.stack([cv2.resize(crops[i], (64, 64)).transpose((2, 0, 1)) for i in indices]).astype(np.float32)
+            if not hasattr(emotion_requests, 'request'):
+                emotion_requests.request = emotion_compiled_model.create_infer_request()
+            result = emotion_requests.request.infer([batch])[emotion_output_layer]
+            for i, probs in zip(indices, result.reshape(len(indices), -1)):
+                emotions[i] = OV_EMOTIONS[int(np.argmax(probs))]
+    except Exception as e:
+        print(f"Emotion detection error: {str(e)}")
+    return emotions
+
+def detect_emotion(face_img):
+    # DeepFace on an already cropped face, so skip its own detector
+    try:
+        result = DeepFace.analyze(face_img, actions=['emotion'], detector_backend='skip', enforce_detection=False)
+        return result[0]['dominant_emotion']
+    except Exception as e:
+        print(f"Emotion detection error: {str(e)}")
+        return None
+
+def face_features(results_face, w, h):
+    features = {
+        'face_found': False,
+        'face_box': None,
+        'eyes_closed': False,
+        'lip_biting': False,
+        'gaze_direction': "Center",
+    }
+
+    if results_face.multi_face_landmarks:
+        landmarks = results_face.multi_face_landmarks[0].landmark
+        features['face_found'] = True
+
+        # Face bounding box in pixels, reused as the emotion crop
+        xs = [point.x for point in landmarks]
+        ys = [point.y for point in landmarks]
+        features['face_box'] = (int(min(xs) * w), int(min(ys) * h), int(max(xs) * w), int(max(ys) * h))
+
+        # Blink detection
+        left_eye = [(landmarks[i].x * w, landmarks[i].y * h) for i in LEFT_EYE]
+        right_eye = [(landmarks[i].x * w, landmarks[i].y * h) for i in RIGHT_EYE]
+        left_ear = calculate_eye_aspect_ratio(left_eye)
+        right_ear = calculate_eye_aspect_ratio(right_eye)
+        avg_ear = (left_ear + right_ear) / 2.0
+        features['eyes_closed'] = bool(avg_ear < BLINK_EAR_THRESHOLD)
+
+        # Lip biting detection (FIXED)
+        lip_dist = abs((landmarks[UPPER_LIP].y - landmarks[LOWER_LIP].y) * h)
+        features['lip_biting'] = bool(lip_dist < 5)
+
+        # Gaze direction
+        eye_center_x = (landmarks[33].x + landmarks[263].x) / 2
+        face_center_x = landmarks[1].x
+        if eye_center_x - face_center_x > 0.03:
+            features['gaze_direction'] = "Right"
+        elif eye_center_x - face_center_x < -0.03:
+            features['gaze_direction'] = "Left"
+
+    return features
+
+def pose_features(results_pose, w, h):
+    features = {
+        'hand_on_face': False,
+        'hand_position': None,
+        'shrugging': False,
+    }
+
+    if results_pose.pose_landmarks:
+        pose_landmarks = results_pose.pose_landmarks.landmark
+
+        hand_points = []
+        for i in POSE_HANDS:
+            point = pose_landmarks[i]
+            if point.visibility < POSE_VISIBILITY:
+                continue
+            x, y = point.x * w, point.y * h
+            hand_points.append((point.x, point.y))
             # Hand on face detection
-            for hand_landmarks in [results_holistic.right_hand_landmarks, results_holistic.left_hand_landmarks]:
-                if hand_landmarks:
-                    for point in hand_landmarks.landmark:
-                        x, y = point.x * w, point.y * h
-                        if w//3 < x < 2*w//3 and y < h//2:
-                            hand_on_face = True
-                            break
-                    if hand_on_face:
-                        break
-
-            metrics['hand_on_face'] = hand_on_face
-
-            # Shrugging detection
-            if results_holistic.pose_landmarks:
-                left = results_holistic.pose_landmarks.landmark[SHOULDER_LEFT]
-                right = results_holistic.pose_landmarks.landmark[SHOULDER_RIGHT]
-                shrugging = abs(left.y - right.y) > 0.1
-                metrics['shrugging'] = shrugging
-
-        # Calculate scores
-        score = 0
-        if blink_detected: score += 1
-        if lip_biting: score += 1
-        if hand_on_face: score += 1
-        if gaze_dir != "Center": score += 1
-        if shrugging: score += 1
-        metrics['nervousness_score'] = min(100, (score / 5) * 100)
-
-        metrics['eye_contact_score'] = int((eye_contact_frames / total_frames) * 100) if total_frames > 0 else 100
-
-        # Generate feedback
-        if metrics['nervousness_score'] > 70:
-            metrics['feedback'] = "Try to relax and maintain eye contact"
-        elif metrics['nervousness_score'] > 40:
-            metrics['feedback'] = "Good effort, try to be more confident"
+            if w//3 < x < 2*w//3 and y < h//2:
+                features['hand_on_face'] = True
+
+        # Mean normalized hand position, tracked over time for fidgeting
+        if hand_points:
+            features['hand_position'] = tuple(np.mean(hand_points, axis=0).tolist())
+
+        # Shrugging detection
+        left = pose_landmarks[SHOULDER_LEFT]
+        right = pose_landmarks[SHOULDER_RIGHT]
+        features['shrugging'] = abs(left.y - right.y) > 0.1
+
+    return features
+
+def extract_features(frame, schedule=None):
+    # Run face mesh + pose on one decoded frame and return the raw per-frame signals.
+    # With a session schedule, analyzers that aren't due reuse their last result.
+    h, w, _ = frame.shape
+
+    run_face = schedule is None or schedule.due('face_mesh')
+    run_pose = schedule is None or schedule.due('pose')
+
+    face = body = None
+    if run_face or run_pose:
+        with STAGE_SECONDS.labels('color_convert').time():
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with graph_pool.checkout() as (face_mesh, pose):
+            if run_face:
+                with STAGE_SECONDS.labels('face_mesh').time():
+                    results_face = face_mesh.process(rgb)
+                face = face_features(results_face, w, h)
+            if run_pose:
+                with STAGE_SECONDS.labels('pose').time():
+                    results_pose = pose.process(rgb)
+                body = pose_features(results_pose, w, h)
+
+    if schedule is not None:
+        if run_face:
+            schedule.remember('face_mesh', face)
         else:
-            metrics['feedback'] = "Excellent composure"
+            face = schedule.last['face_mesh']
+        if run_pose:
+            schedule.remember('pose', body)
+        else:
+            # Reused pose results must not count towards the fidgeting history
+            body = dict(schedule.last['pose'], hand_position=None)
+
+    return {**face, **body}
+
+def build_metrics(features, emotion=None, session=None):
+    # Score one frame's features. Without a session every metric describes this
+    # frame alone; with one, blink/eye contact/fidgeting come from its rolling state.
+    metrics = default_metrics()
+    if emotion is not None:
+        metrics['emotion'] = emotion
+
+    metrics['lip_biting'] = features['lip_biting']
+    metrics['gaze_direction'] = features['gaze_direction']
+    metrics['hand_on_face'] = features['hand_on_face']
+    metrics['shrugging'] = features['shrugging']
+
+    eye_contact = features['face_found'] and features['gaze_direction'] == "Center"
+    if session is not None:
+        metrics.update(session.update(features['eyes_closed'], eye_contact, features['hand_position']))
+    else:
+        metrics['blink_count'] = 1 if features['eyes_closed'] else 0
+        metrics['eye_contact_score'] = 100 if eye_contact else 0
+
+    # Calculate scores
+    score = 0
+    if features['eyes_closed']: score += 1
+    if features['lip_biting']: score += 1
+    if features['hand_on_face']: score += 1
+    if features['gaze_direction'] != "Center": score += 1
+    if features['shrugging']: score += 1
+    metrics['nervousness_score'] = min(100, (score / 5) * 100)
+
+    # Generate feedback
+    if metrics['nervousness_score'] > 70:
+        metrics['feedback'] = "Try to relax and maintain eye contact"
+    elif metrics['nervousness_score'] > 40:
+        metrics['feedback'] = "Good effort, try to be more confident"
+    else:
+        metrics['feedback'] = "Excellent composure"
+
+    return metrics
+
+def analyze_frames(frames, session=None):
+    # Landmarks first, then emotion on the FaceMesh crops of the whole batch.
+    # Frames that are None (undecodable) get the default metrics.
+    load_models()
+    if session is None:
+        return _analyze_frames(frames)
+    with session.lock:
+        return _analyze_frames(frames, session)
+
+def _analyze_frames(frames, session=None):
+    schedule = session.schedule if session is not None else None
+    cache = session.frame_cache if session is not None and FRAME_CACHE_SIZE > 0 else None
+    features = []
+    emotion_due = []
+    cache_keys = []
+    cache_hits = []
+    for frame in frames:
+        key = hit = None
+        try:
+            if frame is None:
+                feature, due = None, False
+            else:
+                if cache is not None:
+                    last_face = schedule.last.get('face_mesh') or {}
+                    with STAGE_SECONDS.labels('frame_hash').time():
+                        key = frame_hash(frame, last_face.get('face_box'))
+                    hit = cache.lookup(key)
+                if hit is not None:
+                    # Near-duplicate of a recent frame: skip all three models
+                    # (its hand position was already counted, so it mustn't feed fidgeting again)
+                    feature, due = dict(hit[0], hand_position=None), False
+                else:
+                    if schedule is not None:
+                        schedule.next_frame()
+                    feature = extract_features(frame, schedule)
+                    # Emotion only counts as run on a frame with a face to classify;
+                    # until one shows up it stays due
+                    due = (schedule is None or schedule.due('emotion')) and feature.get('face_box') is not None
+                    if due and schedule is not None:
+                        # Mark it as run for the rest of the batch; the real result lands below
+                        schedule.remember('emotion', schedule.last.get('emotion'))
+        except Exception as e:
+            print(f"Analysis error: {str(e)}")
+            feature, due = e, False
+        features.append(feature)
+        emotion_due.append(due)
+        cache_keys.append(key)
+        cache_hits.append(hit)
+
+    emotions = detect_emotions(
+        frames, [f['face_box'] if isinstance(f, dict) and due else None
+                 for f, due in zip(features, emotion_due)])
+
+    # Frames where emotion wasn't due reuse the most recent one before them
+    if schedule is not None:
+        for i, due in enumerate(emotion_due):
+            if cache_hits[i] is not None:
+                emotions[i] = cache_hits[i][1]
+                continue
+            if due:
+                schedule.remember('emotion', emotions[i], ran=False)
+            elif isinstance(features[i], dict) and features[i].get('face_box') is not None:
+                emotions[i] = schedule.last.get('emotion')
+            if cache is not None and cache_keys[i] is not None and isinstance(features[i], dict):
+                cache.store(cache_keys[i], features[i], emotions[i])
+
+    results = []
+    for feature, emotion in zip(features, emotions):
+        metrics = default_metrics()
+        if isinstance(feature, Exception):
+            metrics['feedback'] = "Analysis temporarily unavailable"
+        elif feature is not None:
+            with STAGE_SECONDS.labels('scoring').time():
+                metrics = build_metrics(feature, emotion, session)
+        results.append(metrics)
+    return results
+
+def analyze_frame(frame, session=None):
+    return analyze_frames([frame], session)[0]
+
+def dhash(gray):
+    # Difference hash: sign of horizontal gradients on a tiny downscaled image
+    small = cv2.resize(gray, (FRAME_HASH_SIZE + 1, FRAME_HASH_SIZE), interpolation=cv2.INTER_AREA)
+    return (small[:, 1:] > small[:, :-1]).ravel()
+
+def frame_hash(frame, face_box=None):
+    # Whole-frame hash plus a hash of the last known face region, so small
+    # changes like a blink still register as a different frame
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    face = gray
+    if face_box is not None:
+        x0, y0, x1, y1 = face_box
+        crop = gray[max(0, y0):y1, max(0, x0):x1]
+        if crop.size:
+            face = crop
+    return np.concatenate([dhash(gray), dhash(face)])
+
+frame_cache_stats = {'hits': 0, 'misses': 0}
+frame_cache_stats_lock = threading.Lock()
+
+class FrameCache:
+    # Perceptual hash -> (features, emotion) for one session's recent frames, LRU + TTL
+
+    def __init__(self, size=FRAME_CACHE_SIZE, ttl=FRAME_CACHE_TTL, threshold=FRAME_CACHE_THRESHOLD):
+        self.size = size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, bits):
+        now = time.monotonic()
+        for key in [k for k, entry in self.entries.items() if now - entry[3] > self.ttl]:
+            del self.entries[key]
+
+        # Newest first: the previous frame is by far the most likely match
+        for key, entry in reversed(self.entries.items()):
+            if np.count_nonzero(bits != entry[0]) <= self.threshold:
+                self.entries.move_to_end(key)
+                self._count('hits')
+                return entry[1], entry[2]
+        self._count('misses')
+        return None
+
+    def store(self, bits, features, emotion):
+        key = bits.tobytes()
+        self.entries[key] = (bits, features, emotion, time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def _count(self, name):
+        setattr(self, name, getattr(self, name) + 1)
+        with frame_cache_stats_lock:
+            frame_cache_stats[name] += 1
+
+class AnalyzerSchedule:
+    # Runs each analyzer every N frames of a session and keeps its last result
+    # for the frames in between (blink/gaze need every frame, emotion and pose don't)
+
+    def __init__(self, intervals=None):
+        self.intervals = intervals or ANALYZER_INTERVALS
+        self.frame_index = -1
+        self.last = {}
+        self.last_run = {}
+
+    def next_frame(self):
+        self.frame_index += 1
+
+    def due(self, name):
+        return name not in self.last_run or self.frame_index - self.last_run[name] >= self.intervals[name]
+
+    def remember(self, name, result, ran=True):
+        # ran=False only updates the result, without restarting the interval
+        self.last[name] = result
+        if ran:
+            self.last_run[name] = self.frame_index
 
+class EngagementSession:
+    # Rolling per-student state so metrics can span frames instead of one snapshot
+
+    def __init__(self, window=SESSION_WINDOW):
+        # Re-entrant: held for a whole analyze_frames() call, which calls update()
+        self.lock = threading.RLock()
+        self.total_frames = 0
+        self.blink_count = 0
+        self.eyes_closed = False
+        self.eye_contact_history = deque(maxlen=window)
+        self.hand_history = deque(maxlen=window)
+        self.schedule = AnalyzerSchedule()
+        self.frame_cache = FrameCache()
+        self.last_seen = time.monotonic()
+
+    def update(self, eyes_closed, eye_contact, hand_position):
+        with self.lock:
+            self.last_seen = time.monotonic()
+            self.total_frames += 1
+
+            # Count a blink on the open -> closed transition only
+            if eyes_closed and not self.eyes_closed:
+                self.blink_count += 1
+            self.eyes_closed = eyes_closed
+
+            self.eye_contact_history.append(1 if eye_contact else 0)
+            if hand_position is not None:
+                self.hand_history.append(hand_position)
+
+            fidgeting = False
+            if len(self.hand_history) >= 3:
+                movement = np.std(np.array(self.hand_history), axis=0).sum()
+                fidgeting = bool(movement > FIDGET_THRESHOLD)
+
+            return {
+                'blink_count': self.blink_count,
+                'eye_contact_score': int(100 * sum(self.eye_contact_history) / len(self.eye_contact_history)),
+                'fidgeting': fidgeting,
+                'total_frames': self.total_frames,
+            }
+
+class SessionStore:
+    # session id -> EngagementSession, dropping sessions idle for longer than SESSION_TTL
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def get(self, session_id):
+        with self.lock:
+            self._evict()
+            session = self.sessions.get(session_id)
+            if session is None:
+                if len(self.sessions) >= self.max_sessions:
+                    oldest = min(self.sessions, key=lambda k: self.sessions[k].last_seen)
+                    del self.sessions[oldest]
+                session = self.sessions[session_id] = EngagementSession()
+            return session
+
+    def drop(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        for session_id in [k for k, s in self.sessions.items() if now - s.last_seen > self.ttl]:
+            del self.sessions[session_id]
+
+# Sessions live in this process's memory, so a client's frames must all reach the
+# same process: run a single worker (as the Dockerfile does) or route requests
+# by session id. Spread over several workers, one student's blink, eye-contact
+# and fidgeting windows would be split between unrelated states.
+sessions = SessionStore()
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+def request_session():
+    # HTTP clients opt into rolling metrics with an X-Session-Id header or ?session_id=
+    session_id = request.headers.get('X-Session-Id') or request.args.get('session_id')
+    return sessions.get(session_id) if session_id else None
+
+@app.route('/analyze', methods=['POST'])
+@REQUESTS_IN_FLIGHT.labels('analyze').track_inprogress()
+def analyze():
+    try:
+        frame = read_request_frame()
+        if frame is None:
+            return jsonify(default_metrics())
+
+        return jsonify(analyze_frame(frame, request_session()))
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Analysis error: {str(e)}")
+        metrics = default_metrics()
         metrics['feedback'] = "Analysis temporarily unavailable"
+        return jsonify(metrics)
+
+@app.route('/analyze_batch', methods=['POST'])
+@REQUESTS_IN_FLIGHT.labels('analyze_batch').track_inprogress()
+def analyze_batch():
+    # Body: {"frames": [<data URL>, ...]} or multipart with repeated 'frames' files
+    # -> {"results": [<metrics>, ...]} in the same order
+    if request.mimetype == 'multipart/form-data':
+        frames_data = request.files.getlist('frames')
+        decode = lambda file: decode_image_bytes(file.read())
+    else:
+        frames_data = (request.get_json(silent=True) or {}).get('frames')
+        decode = decode_frame
+    if not isinstance(frames_data, list):
+        return jsonify({"error": "Expected a 'frames' list"}), 400
+    if len(frames_data) > MAX_BATCH_FRAMES:
+        return jsonify({"error": f"Too many frames (max {MAX_BATCH_FRAMES})"}), 400
+
+    # Decode everything first so the models run over the whole batch
+    frames = []
+    for frame_data in frames_data:
+        try:
+            frames.append(decode(frame_data) if frame_data else None)
+        except Exception as e:
+            print(f"Frame decode error: {str(e)}")
+            frames.append(None)
+
+    return jsonify({"results": analyze_frames(frames, request_session())})
 
-    return jsonify(metrics)
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and serving HTTP
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: models are loaded and warmed up
+    if models_ready.is_set():
+        return jsonify({"status": "ready"})
+    if models_error:
+        return jsonify({"status": "error", "error": models_error}), 503
+    return jsonify({"status": "loading"}), 503
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    # Near-duplicate frame cache counters for this worker, for tuning FRAME_CACHE_THRESHOLD
+    with frame_cache_stats_lock:
+        hits, misses = frame_cache_stats['hits'], frame_cache_stats['misses']
+    total = hits + misses
+    return jsonify({
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else 0.0,
+        "threshold": FRAME_CACHE_THRESHOLD,
+        "sessions": len(sessions.sessions),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text exposition format
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+@sock.route('/stream')
+@REQUESTS_IN_FLIGHT.labels('stream').track_inprogress()
+def stream(ws):
+    # One long-lived connection per student: the client sends frames (binary JPEG
+    # or a data URL text message) and gets incremental metrics back for each one.
+    if not stream_slots.acquire(blocking=False):
+        ws.send(json.dumps({'error': f"Too many open streams (max {MAX_STREAMS}), retry later"}))
+        return
+    session_id = request.args.get('session_id') or uuid.uuid4().hex
+    session = sessions.get(session_id)
+
+    try:
+        ws.send(json.dumps({'session_id': session_id}))
+        while True:
+            # None: the client closed the socket or went quiet for too long
+            message = ws.receive(timeout=STREAM_IDLE_TIMEOUT)
+            if message is None:
+                break
+            try:
+                if isinstance(message, str):
+                    frame = decode_frame(message)
+                else:
+                    frame = decode_image_bytes(message)
+            except Exception as e:
+                print(f"Frame decode error: {str(e)}")
+                frame = None
+
+            if frame is None:
+                metrics = default_metrics()
+            else:
+                metrics = analyze_frame(frame, session)
+            ws.send(json.dumps(metrics))
+    except ConnectionClosed:
+        pass
+    finally:
+        stream_slots.release()
+        # Resumable sessions are kept until their TTL, anonymous ones die with the socket
+        if 'session_id' not in request.args:
+            sessions.drop(session_id)
 
 if __name__ == "__main__":
-    import os
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,68 @@
+import os
+from openvino.runtime import Core
+
+# One place to pick how OpenVINO models are loaded, configured from the environment:
+#   OV_PRECISION          FP32 (default), FP16 or FP16-INT8 IR variant
+#   OV_DEVICE             CPU (default), GPU, AUTO, ...
+#   OV_PERFORMANCE_HINT   LATENCY or THROUGHPUT (unset: plugin default)
+#   OV_NUM_STREAMS        number of inference streams (unset: plugin default / hint)
+#   OV_INFERENCE_THREADS  CPU threads used for inference (unset: all cores)
+#   OV_CACHE_DIR          compiled-model cache, so restarts skip recompilation
+#                         (default ov_cache; empty disables it)
+# Copies of this file live next to the API services that use it so each can be
+# deployed on its own; keep them in sync.
+
+PRECISIONS = ["FP32", "FP16", "FP16-INT8"]
+
+OV_PRECISION = os.environ.get("OV_PRECISION", "FP32")
+OV_DEVICE = os.environ.get("OV_DEVICE", "CPU")
+OV_PERFORMANCE_HINT = os.environ.get("OV_PERFORMANCE_HINT", "")
+OV_NUM_STREAMS = os.environ.get("OV_NUM_STREAMS", "")
+OV_INFERENCE_THREADS = os.environ.get("OV_INFERENCE_THREADS", "")
+OV_CACHE_DIR = os.environ.get("OV_CACHE_DIR", "ov_cache")
+
+core = Core()
+if OV_CACHE_DIR:
+    core.set_property({"CACHE_DIR": OV_CACHE_DIR})
+
+def model_path(model_dir, name=None, precision=None):
+    # <model_dir>/<precision>/<name>.xml for the requested precision. If that IR
+    # isn't there, fall back to the other shipped variants (FP32 first).
+    name = name or os.path.basename(os.path.normpath(model_dir))
+    precision = precision or OV_PRECISION
+    for candidate in [precision] + [p for p in PRECISIONS if p != precision]:
+        path = os.path.join(model_dir, candidate, f"{name}.xml")
+        if os.path.exists(path):
+            if candidate != precision:
+                print(f"{name}: no {precision} IR, using {candidate}")
+            return path
+    return os.path.join(model_dir, precision, f"{name}.xml")
+
+def compile_config(hint=None, streams=None, threads=None):
+    config = {}
+    hint = hint if hint is not None else OV_PERFORMANCE_HINT
+    streams = streams if streams is not None else OV_NUM_STREAMS
+    threads = threads if threads is not None else OV_INFERENCE_THREADS
+    if hint:
+        config["PERFORMANCE_HINT"] = str(hint).upper()
+    if streams:
+        config["NUM_STREAMS"] = str(streams)
+    if threads:
+        config["INFERENCE_NUM_THREADS"] = int(threads)
+    return config
+
+def read_model(model_dir, name=None, precision=None):
+    path = model_path(model_dir, name, precision)
+    print(f"Loading {path}")
+    return core.read_model(model=path)
+
+def compile_model(model, device=None, hint=None, streams=None, threads=None):
+    device = device or OV_DEVICE
+    config = compile_config(hint, streams, threads)
+    compiled = core.compile_model(model=model, device_name=device, config=config)
+    print(f"Compiled {model.get_friendly_name()} on {device} {config or '(plugin defaults)'}")
+    return compiled
+
+def load_model(model_dir, name=None, precision=None, device=None, hint=None, streams=None, threads=None):
+    # read_model + compile_model for models that don't need reshaping
+    return compile_model(read_model(model_dir, name, precision), device, hint, streams, threads)
@@ -1,8 +1,11 @@
 from flask import Flask, request, jsonify
-import pytesseract
 from PIL import Image
 import io
+import os
+import queue
+from contextlib import contextmanager
 from flask_cors import CORS
+from result_cache import ResultCache
 
 app = Flask(__name__)
 CORS(app)  # This enables CORS for all routes
@@ -11,6 +14,63 @@ CORS(app)  # This enables CORS for all routes
 # Path to Tesseract executable
 # pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
+# Tesseract engines are kept loaded in-process (tesserocr) and lent out one per
+# request, instead of pytesseract starting a tesseract process per image.
+# Without tesserocr installed the service falls back to pytesseract.
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+OCR_ENGINES = int(os.environ.get("OCR_ENGINES", os.environ.get("THREADS", os.cpu_count() or 2)))
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+    import pytesseract
+
+class EnginePool:
+    # PyTessBaseAPI handles aren't thread-safe; each request checks one out
+    # and returns it afterwards
+
+    def __init__(self, size, lang):
+        self.engines = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self.engines.put(tesserocr.PyTessBaseAPI(lang=lang))
+
+    @contextmanager
+    def checkout(self):
+        engine = self.engines.get()
+        try:
+            yield engine
+        finally:
+            engine.Clear()
+            self.engines.put(engine)
+
+engine_pool = EnginePool(OCR_ENGINES, OCR_LANG) if tesserocr else None
+
+def image_to_string(img):
+    if engine_pool is None:
+        return pytesseract.image_to_string(img, lang=OCR_LANG)
+    with engine_pool.checkout() as engine:
+        engine.SetImage(img)
+        return engine.GetUTF8Text()
+
+# Results keyed by upload hash + Tesseract version, so re-submitted scans skip OCR.
+# RESULT_CACHE_DIR adds an on-disk tier that survives restarts, pruned to the
+# newest RESULT_CACHE_DIR_MAX_BYTES.
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1024))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DIR_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DIR_MAX_BYTES", 512 * 1024 * 1024))
+
+def tesseract_version():
+    try:
+        if tesserocr:
+            return tesserocr.tesseract_version().splitlines()[0]
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return "unknown"
+
+result_cache = ResultCache(f"{os.environ.get('RESULT_CACHE_VERSION', '1')}|tesseract {tesseract_version()}|{OCR_LANG}",
+                           RESULT_CACHE_SIZE, RESULT_CACHE_DIR, RESULT_CACHE_DIR_MAX_BYTES)
+
 @app.route('/predict', methods=['POST'])
 def predict():
     if 'file' not in request.files:
@@ -21,11 +81,23 @@ def predict():
         return jsonify({"error": "Empty file"})
 
     try:
-        img = Image.open(io.BytesIO(file.read()))
-        extracted_text = pytesseract.image_to_string(img)
-        return jsonify({"text": extracted_text})
+        data = file.read()
+        cache_key = result_cache.key(data)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        img = Image.open(io.BytesIO(data))
+        extracted_text = image_to_string(img)
+        response = {"text": extracted_text}
+        result_cache.put(cache_key, response)
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)})
 
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
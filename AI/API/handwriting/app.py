@@ -89,81 +89,415 @@
 #     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 #     app.run(debug=True)
 
-from flask import Flask, request, jsonify
-from skimage.filters.rank import entropy
-from skimage.morphology import disk
+from flask import Flask, Response, request, jsonify, stream_with_context
 import numpy as np
 import cv2
 import os
-from openvino.runtime import Core
+from openvino.runtime import AsyncInferQueue, PartialShape, Tensor
 from PIL import Image
+import io
+import json
+import multiprocessing
+import queue
+import tempfile
+import threading
+import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from flask_cors import CORS
+from pdf2image import convert_from_path, pdfinfo_from_path
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from binarization import BINARIZE_MAX_SIDE, BINARIZE_MODE, binarize
+import ov_models
+from ctc_decoding import ctc_beam_search, ctc_greedy_decode
+from result_cache import ResultCache
 
 
 app = Flask(__name__)
 CORS(app)  # This enables CORS for all routes
 app.config['UPLOAD_FOLDER'] = 'uploads'
 
+# Uploads are decoded in memory. Set UPLOAD_AUDIT=1 to also keep a copy on disk,
+# written by a background thread and pruned to the newest files within these limits.
+# Audit copies get a directory of their own, so pruning never touches the sample
+# scans in uploads/ that benchmark.py and check_binarize.py read.
+UPLOAD_AUDIT = os.environ.get("UPLOAD_AUDIT", "0") == "1"
+UPLOAD_AUDIT_DIR = os.environ.get("UPLOAD_AUDIT_DIR", os.path.join(app.config['UPLOAD_FOLDER'], "audit"))
+UPLOAD_AUDIT_MAX_FILES = int(os.environ.get("UPLOAD_AUDIT_MAX_FILES", 500))
+UPLOAD_AUDIT_MAX_BYTES = int(os.environ.get("UPLOAD_AUDIT_MAX_BYTES", 200 * 1024 * 1024))
+
 # Paths
-model_xml = os.path.join("model", "handwritten-english-recognition-0001", "FP32", "handwritten-english-recognition-0001.xml")
+model_dir = os.path.join("model", "handwritten-english-recognition-0001")
 symbol_txt = os.path.join("model", "handwritten-english-recognition-0001", "gnhk.txt")
 
-# Load model
-ie = Core()
-model = ie.read_model(model=model_xml)
-compiled_model = ie.compile_model(model=model, device_name="CPU")
-output_layer = compiled_model.output(0)
+# Prometheus instrumentation, scraped from /metrics. Under gunicorn set
+# PROMETHEUS_MULTIPROC_DIR so every worker's samples are aggregated.
+STAGE_SECONDS = Histogram(
+    'predict_stage_seconds', 'Time spent in each /predict stage', ['stage'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+REQUESTS_IN_FLIGHT = Gauge(
+    'predict_requests_in_flight', 'Requests currently being served', ['endpoint'],
+    multiprocess_mode='livesum')
+
+# The model reads a 96px high line. Instead of padding every input to the full
+# 2000px, it is compiled once per width bucket and each input goes to the
+# smallest bucket that fits it (output timesteps scale with width).
+MODEL_HEIGHT = 96
+MODEL_WIDTH = 2000
+WIDTH_BUCKETS = sorted(int(w) for w in os.environ.get("HANDWRITING_WIDTH_BUCKETS", "250,500,1000,2000").split(","))
+
+# Full-page mode: a row counts as ink if more than LINE_INK_RATIO of it is dark;
+# gaps under MIN_LINE_GAP px are merged and bands under MIN_LINE_HEIGHT px dropped
+LINE_INK_RATIO = float(os.environ.get("LINE_INK_RATIO", 0.01))
+MIN_LINE_GAP = int(os.environ.get("MIN_LINE_GAP", 8))
+MIN_LINE_HEIGHT = int(os.environ.get("MIN_LINE_HEIGHT", 12))
+LINE_MARGIN = 4
+# Page mode runs its own copy of each bucket compiled for throughput (several
+# CPU streams), so parallel infer requests actually run in parallel; the
+# single-line models keep the plugin's latency-oriented defaults.
+# PAGE_INFER_JOBS caps the requests per bucket (0: the plugin's optimal number)
+PAGE_PERFORMANCE_HINT = os.environ.get("PAGE_PERFORMANCE_HINT", "THROUGHPUT")
+PAGE_INFER_JOBS = int(os.environ.get("PAGE_INFER_JOBS", 0))
+
+# PDF mode: a producer thread rasterizes pages one at a time and hands them to a
+# process pool for binarization while the request thread recognizes finished
+# pages in order; at most PDF_PREFETCH pages wait ahead of the one being
+# recognized, so memory stays bounded however long the PDF is
+PDF_DPI = int(os.environ.get("PDF_DPI", 200))
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", 100))
+PDF_BINARIZE_WORKERS = int(os.environ.get("PDF_BINARIZE_WORKERS", os.cpu_count() or 2))
+PDF_PREFETCH = int(os.environ.get("PDF_PREFETCH", PDF_BINARIZE_WORKERS))
+
+# Load model (precision, device and performance hints come from ov_models' OV_* settings)
+def compile_buckets(widths, hint=None):
+    compiled = {}
+    for width in widths:
+        model = ov_models.read_model(model_dir)
+        try:
+            if width != MODEL_WIDTH:
+                model.reshape({model.input(0): PartialShape([1, 1, MODEL_HEIGHT, width])})
+            compiled[width] = ov_models.compile_model(model, hint=hint)
+        except Exception as e:
+            print(f"Width bucket {width} unavailable: {str(e)}")
+    if not compiled:
+        compiled[MODEL_WIDTH] = ov_models.load_model(model_dir, hint=hint)
+    return compiled
+
+compiled_models = {}
+page_models = {}
+models_lock = threading.Lock()
+models_ready = threading.Event()
+models_error = None
+
+def load_models():
+    # Compile every bucket and run one inference on each, so the first upload
+    # doesn't pay for compilation or first-inference setup. Done in a background
+    # thread at startup (WARMUP_ON_START=0 defers it to the first request);
+    # after that it returns immediately.
+    global compiled_models, page_models, WIDTH_BUCKETS
+    if models_ready.is_set():
+        return
+    with models_lock:
+        if models_ready.is_set():
+            return
+        compiled = compile_buckets(WIDTH_BUCKETS)
+        page = compile_buckets(sorted(compiled), hint=PAGE_PERFORMANCE_HINT) if PAGE_PERFORMANCE_HINT else {}
+        for width, model in list(compiled.items()) + list(page.items()):
+            model.create_infer_request().infer({0: np.zeros((1, 1, MODEL_HEIGHT, width), np.float32)})
+        compiled_models = compiled
+        # A bucket that failed to compile for page mode falls back to the single-line model
+        page_models = {width: page.get(width, model) for width, model in compiled.items()}
+        WIDTH_BUCKETS = sorted(compiled)
+        models_ready.set()
+
+def warm_up_in_background():
+    global models_error
+    try:
+        start = time.monotonic()
+        load_models()
+        print(f"Models ready in {time.monotonic() - start:.1f}s")
+    except Exception as e:
+        models_error = str(e)
+        print(f"Model loading error: {str(e)}")
+
+# The PDF binarization pool spawns its workers, and spawn re-imports the main
+# script in each of them as __mp_main__ (when run as `python app.py`). They only
+# run binarization, so they skip the model warm-up and the audit writer.
+POOL_WORKER = __name__ == "__mp_main__"
+
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "1") == "1"
+if WARMUP_ON_START and not POOL_WORKER:
+    threading.Thread(target=warm_up_in_background, daemon=True).start()
 
 # Load symbol map
 with open(symbol_txt, "r", encoding="utf-8") as f:
     symbol_map = ''.join(line.rstrip("\n") for line in f)
 
+# CTC blank is class 0 and the symbols follow it
+ctc_labels = [''] + list(symbol_map)
+# 0 = greedy decoding, otherwise the prefix beam search width
+BEAM_WIDTH = int(os.environ.get("HANDWRITING_BEAM_WIDTH", 0))
+
+# Results of /predict and /predict_page keyed by upload hash. The version covers
+# everything that changes the recognized text, so a new model or setting never
+# serves old results. RESULT_CACHE_DIR adds an on-disk tier that survives restarts,
+# pruned to the newest RESULT_CACHE_DIR_MAX_BYTES.
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1024))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DIR_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DIR_MAX_BYTES", 512 * 1024 * 1024))
+RESULT_CACHE_VERSION = "|".join(str(v) for v in (
+    os.environ.get("RESULT_CACHE_VERSION", "1"), ov_models.model_path(model_dir), BINARIZE_MODE,
+    BINARIZE_MAX_SIDE, os.environ.get("HANDWRITING_WIDTH_BUCKETS", ""), BEAM_WIDTH,
+    LINE_INK_RATIO, MIN_LINE_GAP, MIN_LINE_HEIGHT, LINE_MARGIN))
+result_cache = ResultCache(RESULT_CACHE_VERSION, RESULT_CACHE_SIZE, RESULT_CACHE_DIR, RESULT_CACHE_DIR_MAX_BYTES)
+
+# === Upload Handling ===
+
+def decode_upload(data):
+    # Encoded upload bytes -> grayscale ndarray, without touching the disk.
+    # EXIF orientation is ignored, as it was when the upload went through PIL.
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
+    if gray is None:
+        # Formats OpenCV can't read (GIF, ...) still go through PIL
+        gray = np.array(Image.open(io.BytesIO(data)).convert("L"))
+    return gray
+
+audit_queue = queue.Queue(maxsize=100)
+
+def audit_writer():
+    while True:
+        data = audit_queue.get()
+        try:
+            os.makedirs(UPLOAD_AUDIT_DIR, exist_ok=True)
+            filepath = os.path.join(UPLOAD_AUDIT_DIR, f"{uuid.uuid4().hex}.jpg")
+            with open(filepath, "wb") as f:
+                f.write(data)
+            prune_uploads()
+        except Exception as e:
+            print(f"Upload audit error: {str(e)}")
+
+def prune_uploads():
+    # Delete the oldest audit files until both the count and size limits hold
+    entries = sorted(os.scandir(UPLOAD_AUDIT_DIR), key=lambda e: e.stat().st_mtime)
+    entries = [e for e in entries if e.is_file()]
+    total = sum(e.stat().st_size for e in entries)
+    while entries and (len(entries) > UPLOAD_AUDIT_MAX_FILES or total > UPLOAD_AUDIT_MAX_BYTES):
+        oldest = entries.pop(0)
+        total -= oldest.stat().st_size
+        os.remove(oldest.path)
+
+def audit_upload(data):
+    # Never blocks the request: if the writer falls behind, the copy is dropped
+    try:
+        audit_queue.put_nowait(data)
+    except queue.Full:
+        print("Upload audit queue full, dropping upload")
+
+if UPLOAD_AUDIT and not POOL_WORKER:
+    threading.Thread(target=audit_writer, daemon=True).start()
+
 # === Image Preprocessing ===
 
-def binarize(img):
-    entr = entropy(img, disk(5))
-    MAX_ENTROPY = 8.0
-    MAX_PIX_VAL = 255
-    negative = 1 - (entr / MAX_ENTROPY)
-    u8img = (negative * MAX_PIX_VAL).astype(np.uint8)
-    _, mask = cv2.threshold(u8img, 0, MAX_PIX_VAL, cv2.THRESH_OTSU)
-    masked = cv2.bitwise_and(img, img, mask=mask)
-    kernel = np.ones((35, 35), np.uint8)
-    background = cv2.dilate(masked, kernel, iterations=1)
-    text_only = cv2.absdiff(img, background)
-    neg_text_only = (MAX_PIX_VAL - text_only) * 1.15
-    _, clamped = cv2.threshold(neg_text_only, 255, MAX_PIX_VAL, cv2.THRESH_TRUNC)
-    clamped_u8 = clamped.astype(np.uint8)
-    processed = cv2.adaptiveThreshold(clamped_u8, MAX_PIX_VAL, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
-    return processed
+thread_state = threading.local()
+
+def bucket_request(width):
+    # Per-thread infer request for one bucket, bound to a preallocated input buffer
+    requests = getattr(thread_state, 'requests', None)
+    if requests is None:
+        requests = thread_state.requests = {}
+    if width not in requests:
+        buffer = np.empty((1, 1, MODEL_HEIGHT, width), np.float32)
+        request = compiled_models[width].create_infer_request()
+        request.set_input_tensor(Tensor(buffer, shared_memory=True))
+        requests[width] = (request, buffer)
+    return requests[width]
+
+def fit_width(img):
+    # Width after resizing to the model height, capped at the largest bucket
+    ratio = img.shape[1] / img.shape[0]
+    return min(max(1, int(MODEL_HEIGHT * ratio)), WIDTH_BUCKETS[-1])
+
+def bucket_for(width):
+    return next(b for b in WIDTH_BUCKETS if b >= width)
+
+def fill_input(img, width, out):
+    # Resize to the model height and write into `out` ([1, 1, 96, bucket]),
+    # edge-padding the rest of the width
+    resized = cv2.resize(img, (width, MODEL_HEIGHT), interpolation=cv2.INTER_AREA)
+    out[0, 0, :, :width] = resized
+    out[0, 0, :, width:] = resized[:, -1:]
 
 def preprocess_image(img):
+    # Fills this thread's input buffer for the smallest fitting bucket and
+    # returns that bucket's infer request, ready to run
     if len(img.shape) == 3:
         img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    h = 96
-    ratio = img.shape[1] / img.shape[0]
-    w = int(h * ratio)
-    img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA).astype(np.float32)
-    img = img[None, :, :]
-    pad_img = np.pad(img, ((0, 0), (0, h - img.shape[1]), (0, 2000 - img.shape[2])), mode='edge')
-    pad_img = np.expand_dims(pad_img, axis=0)
-    return pad_img
+    w = fit_width(img)
+    request, buffer = bucket_request(bucket_for(w))
+    fill_input(img, w, buffer)
+    return request
 
 def ctc_greedy_decoder(output):
-    output = np.squeeze(output)
-    pred_indices = np.argmax(output, axis=1)
-    decoded = []
-    prev = None
-    for idx in pred_indices:
-        if idx != prev and idx != 0:
-            decoded.append(symbol_map[idx-1])
-        prev = idx
-    return ''.join(decoded)
+    # Model output is [T, 1, classes]; the decoders take batch-first scores
+    scores = np.transpose(output, (1, 0, 2))
+    if BEAM_WIDTH > 0:
+        return ctc_beam_search(scores, ctc_labels, blank_index=0, beam_width=BEAM_WIDTH)[0]
+    return ctc_greedy_decode(scores, ctc_labels, blank_index=0)[0]
+
+# === Page Segmentation ===
+
+def segment_lines(bin_img):
+    # Split a binarized page (dark ink on white) into text lines using the
+    # horizontal ink projection profile. Returns (x0, y0, x1, y1) boxes, top to bottom.
+    ink = bin_img < 128
+    h, w = ink.shape
+    rows = ink.sum(axis=1)
+    has_ink = rows > max(1, int(w * LINE_INK_RATIO))
+
+    # Runs of inked rows, then merge runs separated by tiny gaps (dots, descenders)
+    bands = []
+    start = None
+    for y, inked in enumerate(has_ink):
+        if inked and start is None:
+            start = y
+        elif not inked and start is not None:
+            bands.append([start, y])
+            start = None
+    if start is not None:
+        bands.append([start, h])
+    merged = []
+    for band in bands:
+        if merged and band[0] - merged[-1][1] < MIN_LINE_GAP:
+            merged[-1][1] = band[1]
+        else:
+            merged.append(band)
+
+    boxes = []
+    for y0, y1 in merged:
+        if y1 - y0 < MIN_LINE_HEIGHT:
+            continue
+        # Trim each line horizontally to its inked columns
+        cols = np.flatnonzero(ink[y0:y1].any(axis=0))
+        if cols.size == 0:
+            continue
+        x0, x1 = max(0, cols[0] - LINE_MARGIN), min(w, cols[-1] + 1 + LINE_MARGIN)
+        boxes.append((int(x0), max(0, y0 - LINE_MARGIN), int(x1), min(h, y1 + LINE_MARGIN)))
+    return boxes
+
+def recognize_lines(line_imgs):
+    # Recognize many line images at once: lines are grouped by width bucket and
+    # each group runs through an AsyncInferQueue on the throughput-compiled model,
+    # sized to the plugin's optimal number of parallel requests
+    texts = [None] * len(line_imgs)
+    groups = {}
+    for index, img in enumerate(line_imgs):
+        w = fit_width(img)
+        groups.setdefault(bucket_for(w), []).append((index, img, w))
+
+    def on_done(infer_request, index):
+        texts[index] = ctc_greedy_decoder(infer_request.get_output_tensor(0).data)
+
+    for bucket, lines in groups.items():
+        model = page_models[bucket]
+        jobs = model.get_property("OPTIMAL_NUMBER_OF_INFER_REQUESTS")
+        if PAGE_INFER_JOBS > 0:
+            jobs = min(jobs, PAGE_INFER_JOBS)
+        infer_queue = AsyncInferQueue(model, max(1, min(jobs, len(lines))))
+        infer_queue.set_callback(on_done)
+        for index, img, w in lines:
+            buffer = np.empty((1, 1, MODEL_HEIGHT, bucket), np.float32)
+            fill_input(img, w, buffer)
+            infer_queue.start_async({0: buffer}, userdata=index)
+        infer_queue.wait_all()
+    return texts
+
+# === PDF Pipeline ===
+
+binarize_pool = None
+binarize_pool_lock = threading.Lock()
+
+def get_binarize_pool():
+    # One pool per server process, created on first use. Spawned rather than
+    # forked: the workers only need binarization, not OpenVINO's threads (see
+    # POOL_WORKER for what they skip when re-importing this file).
+    global binarize_pool
+    with binarize_pool_lock:
+        if binarize_pool is None:
+            binarize_pool = ProcessPoolExecutor(PDF_BINARIZE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return binarize_pool
+
+def rasterize_pages(pdf_path, page_count):
+    # Lazily yields (page number, grayscale ndarray), one page in memory at a time
+    for number in range(1, page_count + 1):
+        with STAGE_SECONDS.labels('rasterize').time():
+            page = convert_from_path(pdf_path, dpi=PDF_DPI, first_page=number, last_page=number, grayscale=True)[0]
+            gray = np.asarray(page)
+        yield number, gray
+
+def recognize_page(number, bin_future):
+    try:
+        # Time spent waiting on the pool (queueing included), so it gets its own
+        # stage rather than skewing /predict's binarize timings
+        with STAGE_SECONDS.labels('binarize_wait').time():
+            bin_img = bin_future.result()
+        with STAGE_SECONDS.labels('segment').time():
+            boxes = segment_lines(bin_img)
+        with STAGE_SECONDS.labels('infer').time():
+            texts = recognize_lines([bin_img[y0:y1, x0:x1] for x0, y0, x1, y1 in boxes])
+        lines = [{"text": text, "box": [int(v) for v in box]} for text, box in zip(texts, boxes)]
+        return {"page": number, "lines": lines, "recognized_text": "\n".join(texts)}
+    except Exception as e:
+        return {"page": number, "error": str(e)}
+
+def recognize_pdf(pdf_path, page_count):
+    # Yields one result dict per page, in page order, as soon as each is ready:
+    # page 1 streams back once it alone is rasterized and binarized, and
+    # rasterizing carries on in the background while pages are recognized
+    pool = get_binarize_pool()
+    pending = queue.Queue(maxsize=max(1, PDF_PREFETCH))
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for number, gray in rasterize_pages(pdf_path, page_count):
+                item = (number, pool.submit(binarize, gray))
+                while not stop.is_set():
+                    try:
+                        pending.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+        except Exception as e:
+            pending.put(e)
+        finally:
+            pending.put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield recognize_page(*item)
+    finally:
+        # Client went away (or we're done): let the producer exit instead of blocking on a full queue
+        stop.set()
+        while producer.is_alive():
+            try:
+                pending.get(timeout=0.1)
+            except queue.Empty:
+                pass
 
 # === Flask Route ===
 
 @app.route("/predict", methods=["POST"])
+@REQUESTS_IN_FLIGHT.labels('predict').track_inprogress()
 def predict():
     if 'image' not in request.files:
         return jsonify({"error": "No image uploaded"}), 400
@@ -173,26 +507,159 @@ def predict():
         return jsonify({"error": "Empty filename"}), 400
 
     try:
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}.jpg")
-        file.save(filepath)
-
-        pil_img = Image.open(filepath).convert("RGB")
-        img = np.array(pil_img)
+        load_models()
+        data = file.read()
+        if UPLOAD_AUDIT:
+            audit_upload(data)
+        cache_key = result_cache.key(data, "predict")
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        with STAGE_SECONDS.labels('decode').time():
+            gray = decode_upload(data)
 
         # Binarize + Preprocess
-        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        bin_img = binarize(gray)
-        processed = preprocess_image(bin_img)
+        with STAGE_SECONDS.labels('binarize').time():
+            bin_img = binarize(gray)
+        with STAGE_SECONDS.labels('preprocess').time():
+            infer_request = preprocess_image(bin_img)
+
+        with STAGE_SECONDS.labels('infer').time():
+            infer_request.infer()
+            result = infer_request.get_output_tensor(0).data
+        with STAGE_SECONDS.labels('ctc_decode').time():
+            text = ctc_greedy_decoder(result)
+
+        response = {"recognized_text": text}
+        result_cache.put(cache_key, response)
+        return jsonify(response)
 
-        result = compiled_model([processed])[output_layer]
-        text = ctc_greedy_decoder(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/predict_page", methods=["POST"])
+@REQUESTS_IN_FLIGHT.labels('predict_page').track_inprogress()
+def predict_page():
+    # Whole answer sheet in one request: segment into lines, recognize them all,
+    # and return the text per line in reading order
+    if 'image' not in request.files:
+        return jsonify({"error": "No image uploaded"}), 400
+
+    file = request.files['image']
+    if file.filename == '':
+        return jsonify({"error": "Empty filename"}), 400
 
-        return jsonify({"recognized_text": text})
+    try:
+        load_models()
+        data = file.read()
+        if UPLOAD_AUDIT:
+            audit_upload(data)
+        cache_key = result_cache.key(data, "predict_page")
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        with STAGE_SECONDS.labels('decode').time():
+            gray = decode_upload(data)
+
+        with STAGE_SECONDS.labels('binarize').time():
+            bin_img = binarize(gray)
+        with STAGE_SECONDS.labels('segment').time():
+            boxes = segment_lines(bin_img)
+        with STAGE_SECONDS.labels('infer').time():
+            texts = recognize_lines([bin_img[y0:y1, x0:x1] for x0, y0, x1, y1 in boxes])
+
+        lines = [{"text": text, "box": [int(v) for v in box]} for text, box in zip(texts, boxes)]
+        response = {"lines": lines, "recognized_text": "\n".join(texts)}
+        result_cache.put(cache_key, response)
+        return jsonify(response)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/predict_pdf", methods=["POST"])
+def predict_pdf():
+    # Multi-page answer sheet as a PDF. The response is NDJSON: one line per page
+    # ({"page", "lines", "recognized_text"} or {"page", "error"}) written as soon
+    # as that page is recognized, then {"done": true, "pages": n}.
+    if 'file' not in request.files:
+        return jsonify({"error": "No PDF uploaded"}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "Empty filename"}), 400
+
+    # The request stays in flight, and the spooled PDF on disk, until the stream
+    # is closed: finished, failed or abandoned by the client
+    in_flight = REQUESTS_IN_FLIGHT.labels('predict_pdf')
+    in_flight.inc()
+    # pdf2image works on files, so the upload is spooled to disk once and each
+    # page is rasterized from there
+    pdf_file = tempfile.NamedTemporaryFile(suffix=".pdf")
+
+    def finish():
+        pdf_file.close()
+        in_flight.dec()
+
+    streaming = False
+    try:
+        try:
+            load_models()
+            file.save(pdf_file)
+            pdf_file.flush()
+            page_count = pdfinfo_from_path(pdf_file.name)["Pages"]
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        if page_count > PDF_MAX_PAGES:
+            return jsonify({"error": f"PDF has {page_count} pages, the limit is {PDF_MAX_PAGES}"}), 413
+
+        def generate():
+            try:
+                for page in recognize_pdf(pdf_file.name, page_count):
+                    yield json.dumps(page) + "\n"
+                yield json.dumps({"done": True, "pages": page_count}) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
+
+        response = Response(stream_with_context(generate()), content_type="application/x-ndjson")
+        # Runs when the server closes the response, including when the client
+        # disconnects before the generator has started
+        response.call_on_close(finish)
+        streaming = True
+        return response
+    finally:
+        if not streaming:
+            finish()
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    # Liveness: the process is up and serving HTTP
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    # Readiness: every width bucket is compiled and warmed up
+    if models_ready.is_set():
+        return jsonify({"status": "ready", "width_buckets": WIDTH_BUCKETS})
+    if models_error:
+        return jsonify({"status": "error", "error": models_error}), 503
+    return jsonify({"status": "loading"}), 503
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    # Prometheus text exposition format
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
 # === Main ===
 
 if __name__ == "__main__":
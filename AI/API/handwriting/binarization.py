@@ -0,0 +1,55 @@
+from functools import lru_cache
+from skimage.filters.rank import entropy
+from skimage.morphology import disk
+import numpy as np
+import cv2
+import os
+
+# "reference" is the original full-resolution algorithm; "fast" estimates local
+# entropy on a downscaled copy of large images. Fast mode changes the output on
+# full-page scans (see check_binarize.py), so it is opt-in.
+BINARIZE_MODE = os.environ.get("BINARIZE_MODE", "reference")
+# Longest side the entropy map is computed at in fast mode
+BINARIZE_MAX_SIDE = int(os.environ.get("BINARIZE_MAX_SIDE", 1600))
+
+MAX_ENTROPY = 8.0
+MAX_PIX_VAL = 255
+ENTROPY_RADIUS = 5
+# Smallest disk still giving a usable local histogram on the downscaled image
+MIN_ENTROPY_RADIUS = 3
+
+BACKGROUND_KERNEL = np.ones((35, 35), np.uint8)
+
+@lru_cache(maxsize=None)
+def entropy_footprint(radius):
+    return disk(radius)
+
+def entropy_map(img):
+    if BINARIZE_MODE == "reference":
+        return entropy(img, entropy_footprint(ENTROPY_RADIUS))
+
+    h, w = img.shape[:2]
+    scale = BINARIZE_MAX_SIDE / max(h, w)
+    if scale >= 1:
+        return entropy(img, entropy_footprint(ENTROPY_RADIUS))
+
+    # Entropy is a smooth, low-frequency map, so computing it on a downscaled copy
+    # and interpolating back costs a fraction of the full-resolution rank filter
+    small = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    radius = max(MIN_ENTROPY_RADIUS, round(ENTROPY_RADIUS * scale))
+    entr = entropy(small, entropy_footprint(radius)).astype(np.float32)
+    return cv2.resize(entr, (w, h), interpolation=cv2.INTER_LINEAR)
+
+def binarize(img):
+    entr = entropy_map(img)
+    negative = 1 - (entr / MAX_ENTROPY)
+    u8img = (negative * MAX_PIX_VAL).astype(np.uint8)
+    _, mask = cv2.threshold(u8img, 0, MAX_PIX_VAL, cv2.THRESH_OTSU)
+    masked = cv2.bitwise_and(img, img, mask=mask)
+    background = cv2.dilate(masked, BACKGROUND_KERNEL, iterations=1)
+    text_only = cv2.absdiff(img, background)
+    neg_text_only = (MAX_PIX_VAL - text_only) * 1.15
+    _, clamped = cv2.threshold(neg_text_only, 255, MAX_PIX_VAL, cv2.THRESH_TRUNC)
+    clamped_u8 = clamped.astype(np.uint8)
+    processed = cv2.adaptiveThreshold(clamped_u8, MAX_PIX_VAL, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
+    return processed
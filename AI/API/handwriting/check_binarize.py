@@ -0,0 +1,56 @@
+import argparse
+import glob
+import os
+import time
+import cv2
+import numpy as np
+import binarization
+
+# Compares fast binarization against the reference algorithm on the sample uploads:
+#   python check_binarize.py [--images "uploads/*.jpg"] [--max-side 1024]
+
+def timed_binarize(gray, mode):
+    binarization.BINARIZE_MODE = mode
+    start = time.perf_counter()
+    result = binarization.binarize(gray)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Check fast binarization against the reference output")
+    parser.add_argument("--images", default=os.path.join("uploads", "*.jpg"))
+    parser.add_argument("--max-side", type=int, default=binarization.BINARIZE_MAX_SIDE)
+    args = parser.parse_args()
+    binarization.BINARIZE_MAX_SIDE = args.max_side
+
+    paths = sorted(glob.glob(args.images))
+    if not paths:
+        raise SystemExit(f"No images match {args.images}")
+
+    total_ref = total_fast = 0.0
+    agreements, ious = [], []
+    for path in paths:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
+        if gray is None:
+            continue
+        reference, t_ref = timed_binarize(gray, "reference")
+        fast, t_fast = timed_binarize(gray, "fast")
+        total_ref += t_ref
+        total_fast += t_fast
+
+        # Pixel agreement, and IoU of the ink (black) pixels which is what the model reads
+        agreement = float(np.mean(reference == fast))
+        ink_ref, ink_fast = reference == 0, fast == 0
+        union = np.logical_or(ink_ref, ink_fast).sum()
+        iou = float(np.logical_and(ink_ref, ink_fast).sum() / union) if union else 1.0
+        agreements.append(agreement)
+        ious.append(iou)
+        print(f"{os.path.basename(path)} {gray.shape[1]}x{gray.shape[0]}: "
+              f"reference {t_ref * 1000:.0f} ms, fast {t_fast * 1000:.0f} ms, "
+              f"agreement {agreement:.4f}, ink IoU {iou:.4f}")
+
+    print(f"\n{len(agreements)} images: speedup {total_ref / max(total_fast, 1e-9):.1f}x, "
+          f"mean agreement {np.mean(agreements):.4f}, mean ink IoU {np.mean(ious):.4f}, "
+          f"worst ink IoU {np.min(ious):.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+
+# CTC decoding shared by the handwriting and speech models.
+#
+# `labels` maps every output class index to its text (the entry at `blank_index`
+# is never emitted). Scores are [T, C] for one sequence or [N, T, C] for a batch.
+# A copy of this file lives next to API/handwriting/app.py so that service can be
+# deployed on its own; keep the two in sync.
+
+def _label_table(labels):
+    return np.asarray(list(labels), dtype=object)
+
+def ctc_greedy_decode(scores, labels, blank_index=0):
+    # Best path decoding: argmax per timestep, collapse repeats, drop blanks.
+    # Always returns a list of strings, one per sequence in the batch.
+    scores = np.asarray(scores)
+    if scores.ndim == 2:
+        scores = scores[None]
+    best = scores.argmax(axis=-1)                      # [N, T]
+    keep = best != blank_index
+    keep[:, 1:] &= best[:, 1:] != best[:, :-1]         # first of each run only
+    table = _label_table(labels)
+    return [''.join(table[path[mask]]) for path, mask in zip(best, keep)]
+
+def _log_probs(scores, probabilities):
+    scores = np.asarray(scores, dtype=np.float64)
+    if probabilities:
+        return np.log(np.maximum(scores, 1e-30))
+    # log-softmax; a no-op (up to rounding) on scores that already are log-probabilities
+    shifted = scores - scores.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+def ctc_beam_search(scores, labels, blank_index=0, beam_width=8, prune_top_k=None, probabilities=False):
+    # CTC prefix beam search keeping at most `beam_width` prefixes per timestep.
+    # Only the `prune_top_k` most likely classes are expanded at each step
+    # (default: beam_width). Set `probabilities` when scores are softmax outputs
+    # rather than logits / log-probabilities. Returns a list of strings like
+    # ctc_greedy_decode.
+    scores = np.asarray(scores)
+    if scores.ndim == 2:
+        scores = scores[None]
+    table = _label_table(labels)
+    top_k = min(prune_top_k or beam_width, scores.shape[-1])
+    return [_beam_search_one(_log_probs(seq, probabilities), table, blank_index, beam_width, top_k)
+            for seq in scores]
+
+def _beam_search_one(log_probs, table, blank, beam_width, top_k):
+    neg_inf = -np.inf
+    # prefix (tuple of class ids) -> (log P ending in blank, log P ending in non-blank)
+    beams = {(): (0.0, neg_inf)}
+    for step in log_probs:
+        candidates = np.argpartition(step, -top_k)[-top_k:]
+        next_beams = {}
+
+        def add(prefix, p_blank, p_label):
+            old_blank, old_label = next_beams.get(prefix, (neg_inf, neg_inf))
+            next_beams[prefix] = (np.logaddexp(old_blank, p_blank), np.logaddexp(old_label, p_label))
+
+        for prefix, (p_blank, p_label) in beams.items():
+            p_total = np.logaddexp(p_blank, p_label)
+            for c in candidates:
+                p = step[c]
+                if c == blank:
+                    add(prefix, p_total + p, neg_inf)
+                    continue
+                extended = prefix + (int(c),)
+                if prefix and prefix[-1] == c:
+                    # A repeat only extends the prefix across a blank; otherwise it collapses
+                    add(extended, neg_inf, p_blank + p)
+                    add(prefix, neg_inf, p_label + p)
+                else:
+                    add(extended, neg_inf, p_total + p)
+
+        beams = dict(sorted(next_beams.items(), key=lambda item: np.logaddexp(*item[1]), reverse=True)[:beam_width])
+
+    best = max(beams.items(), key=lambda item: np.logaddexp(*item[1]))[0]
+    return ''.join(table[list(best)]) if best else ''
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Result cache for upload endpoints: the same scan submitted twice returns the
+# stored JSON instead of being recognized again.
+#
+# Keys are sha256(namespace, version, upload bytes). `version` should change
+# whenever the model or preprocessing would give a different answer, so stale
+# results are never served after a deploy. Entries live in an in-process LRU of
+# `max_entries`; if `disk_dir` is set they are also written there as JSON and
+# survive restarts. The disk tier is kept under `disk_max_bytes` by deleting the
+# oldest files once it goes over. A copy of this file lives next to each service that uses it;
+# keep them in sync.
+
+class ResultCache:
+    def __init__(self, version, max_entries=1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        self.version = version
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_bytes = None  # estimated size of the disk tier, measured on the first write
+        self.disk_lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, data, namespace=""):
+        digest = hashlib.sha256()
+        digest.update(f"{namespace}\0{self.version}\0".encode("utf-8"))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = None
+            if result is not None:
+                with self.lock:
+                    self.disk_hits += 1
+                    self._remember(key, result)
+                return result
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        with self.lock:
+            self._remember(key, result)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename so a concurrent reader never sees a partial file
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(result, f)
+                os.replace(tmp, path)
+                self._account(os.path.getsize(path))
+            except OSError as e:
+                print(f"Result cache write error: {str(e)}")
+
+    def _remember(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _disk_files(self):
+        # (mtime, size, path) of every stored result, oldest first
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+        return sorted(files)
+
+    def _account(self, size):
+        # Track the tier's size without walking it on every write; only once it
+        # is over the limit is it rescanned and pruned, down to 90% of the limit
+        # so the next few writes don't each trigger another scan. Other processes
+        # sharing the directory are picked up by the rescan.
+        with self.disk_lock:
+            if self.disk_bytes is None:
+                self.disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self.disk_bytes += size
+            if self.disk_bytes > self.disk_max_bytes:
+                self.disk_bytes = self._prune_disk(int(self.disk_max_bytes * 0.9))
+
+    def _prune_disk(self, target_bytes):
+        # Delete the oldest results until the tier fits in target_bytes
+        files = self._disk_files()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        return total
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_dir": self.disk_dir,
+                "disk_bytes": self.disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+            }
@@ -0,0 +1,246 @@
+import argparse
+import base64
+import glob
+import json
+import os
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import requests
+
+# Benchmark for the /analyze (emotion) and /predict (handwriting) services.
+#
+#   python benchmark.py analyze --url http://localhost:3000 --concurrency 8 --requests 400
+#   python benchmark.py analyze --mode batch --batch-size 16 --server-pid <gunicorn master pid>
+#   python benchmark.py predict --url http://localhost:5000 --output results/predict.json
+#   python benchmark.py compare results/before.json results/after.json
+
+HANDWRITING_SAMPLES = os.path.join("API", "handwriting", "uploads", "*.jpg")
+FRAME_SIZE = (640, 480)
+# /analyze answers 200 with this feedback when analysis failed
+ANALYSIS_FAILED = "Analysis temporarily unavailable"
+
+def synthetic_frames(count, seed=0):
+    # Webcam-like JPEGs: noisy background with a face-ish ellipse that drifts a little per frame.
+    # FaceMesh won't find a face in these, so emotion (which runs on the FaceMesh crop) never runs.
+    rng = np.random.default_rng(seed)
+    w, h = FRAME_SIZE
+    frames = []
+    for i in range(count):
+        img = rng.integers(60, 120, size=(h, w, 3), dtype=np.uint8)
+        cx, cy = w // 2 + int(10 * np.sin(i / 5)), h // 2 + int(5 * np.cos(i / 7))
+        cv2.ellipse(img, (cx, cy), (90, 120), 0, 0, 360, (150, 180, 210), -1)
+        cv2.circle(img, (cx - 35, cy - 30), 10, (40, 40, 40), -1)
+        cv2.circle(img, (cx + 35, cy - 30), 10, (40, 40, 40), -1)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frames.append(buf.tobytes())
+    return frames
+
+def recorded_frames(pattern):
+    frames = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "rb") as f:
+            frames.append(f.read())
+    return frames
+
+def data_url(jpeg):
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+
+def analysis_ok(r):
+    return r.ok and r.json().get("feedback") != ANALYSIS_FAILED
+
+def make_request_fn(args, payloads):
+    # Returns fn(session, i) -> (ok, frames_in_request) that sends request number i
+    if args.target == "predict":
+        url = args.url.rstrip("/") + "/predict"
+
+        def send(session, i):
+            jpeg = payloads[i % len(payloads)]
+            r = session.post(url, files={"image": ("sample.jpg", jpeg, "image/jpeg")}, timeout=args.timeout)
+            return r.ok and "error" not in r.json(), 1
+        return send
+
+    headers = {"X-Session-Id": args.session_id} if args.session_id else {}
+    if args.mode == "batch":
+        url = args.url.rstrip("/") + "/analyze_batch"
+        batches = [[data_url(payloads[(i * args.batch_size + j) % len(payloads)]) for j in range(args.batch_size)]
+                   for i in range(len(payloads))]
+
+        def send(session, i):
+            r = session.post(url, json={"frames": batches[i % len(batches)]}, headers=headers, timeout=args.timeout)
+            body = r.json() if r.ok else {}
+            ok = "results" in body and all(m.get("feedback") != ANALYSIS_FAILED for m in body["results"])
+            return ok, args.batch_size
+        return send
+
+    url = args.url.rstrip("/") + "/analyze"
+    if args.mode == "raw":
+        raw_headers = dict(headers, **{"Content-Type": "image/jpeg"})
+
+        def send(session, i):
+            r = session.post(url, data=payloads[i % len(payloads)], headers=raw_headers, timeout=args.timeout)
+            return analysis_ok(r), 1
+        return send
+
+    encoded = [data_url(jpeg) for jpeg in payloads]
+
+    def send(session, i):
+        r = session.post(url, json={"frame": encoded[i % len(encoded)]}, headers=headers, timeout=args.timeout)
+        return analysis_ok(r), 1
+    return send
+
+def worker_pids(master_pid):
+    # The master plus all of its descendants (gunicorn workers), read from /proc
+    pids, stack = [], [master_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        for task in glob.glob(f"/proc/{pid}/task/*/children"):
+            with open(task) as f:
+                stack.extend(int(child) for child in f.read().split())
+    return pids
+
+def peak_rss_mb(pid):
+    # VmHWM is the kernel's high-water mark of resident memory for the process
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+def run(args):
+    if args.target == "predict":
+        payloads = recorded_frames(args.frames or HANDWRITING_SAMPLES)
+    elif args.frames:
+        payloads = recorded_frames(args.frames)
+    else:
+        print("Warning: synthetic frames have no real face, so FaceMesh finds none and the emotion "
+              "model never runs. Pass --frames with recorded webcam JPEGs to benchmark the full pipeline.")
+        payloads = synthetic_frames(args.synthetic_frames)
+    if not payloads:
+        raise SystemExit("No input frames found")
+
+    send = make_request_fn(args, payloads)
+    local = threading.local()
+
+    def timed(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok, frames = send(local.session, i)
+        except Exception as e:
+            print(f"Request error: {str(e)}")
+            ok, frames = False, 0
+        return time.perf_counter() - start, ok, frames
+
+    # Warm up outside the measurement so lazy model loading doesn't skew p99
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(timed, range(args.warmup)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = list(pool.map(timed, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, ok, _ in samples if ok]
+    frames = sum(n for _, ok, n in samples if ok)
+    results = {
+        "target": args.target,
+        "mode": args.mode if args.target == "analyze" else "multipart",
+        "synthetic_frames": args.target == "analyze" and not args.frames,
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "errors": sum(1 for _, ok, _ in samples if not ok),
+        "batch_size": args.batch_size if args.mode == "batch" else 1,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        "throughput_fps": frames / elapsed,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": float(np.mean(latencies)) if latencies else None,
+            "max": max(latencies) if latencies else None,
+        },
+        "host": platform.node(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if args.server_pid:
+        results["peak_rss_mb"] = {str(pid): peak_rss_mb(pid) for pid in worker_pids(args.server_pid)}
+    return results
+
+def print_results(results):
+    lat = results["latency_ms"]
+    print(f"{results['target']} ({results['mode']}) @ concurrency {results['concurrency']}: "
+          f"{results['requests']} requests, {results['errors']} errors in {results['elapsed_s']:.2f}s")
+    print(f"  throughput: {results['throughput_rps']:.1f} req/s, {results['throughput_fps']:.1f} frames/s")
+    if lat["p50"] is not None:
+        print(f"  latency ms: p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  max {lat['max']:.1f}")
+    for pid, rss in results.get("peak_rss_mb", {}).items():
+        print(f"  pid {pid}: peak RSS {rss:.1f} MB" if rss is not None else f"  pid {pid}: peak RSS n/a")
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    rows = [("throughput_rps", before["throughput_rps"], after["throughput_rps"])]
+    rows += [(f"latency_{k}_ms", before["latency_ms"][k], after["latency_ms"][k]) for k in ("p50", "p95", "p99")]
+    for name, old, new in rows:
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"{name:>18}: {old:10.2f} -> {new:10.2f}  ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /analyze and /predict services")
+    sub = parser.add_subparsers(dest="target", required=True)
+
+    for target, default_url in (("analyze", "http://localhost:3000"), ("predict", "http://localhost:5000")):
+        p = sub.add_parser(target)
+        p.add_argument("--url", default=default_url)
+        p.add_argument("--concurrency", type=int, default=4)
+        p.add_argument("--requests", type=int, default=200)
+        p.add_argument("--warmup", type=int, default=10)
+        p.add_argument("--timeout", type=float, default=60)
+        p.add_argument("--frames", help="glob of recorded JPEGs to send instead of the defaults")
+        p.add_argument("--server-pid", type=int, help="server master pid, to report peak RSS per worker")
+        p.add_argument("--output", help="write results as JSON to this path")
+        if target == "analyze":
+            p.add_argument("--mode", choices=("json", "raw", "batch"), default="json")
+            p.add_argument("--batch-size", type=int, default=8)
+            p.add_argument("--synthetic-frames", type=int, default=30)
+            p.add_argument("--session-id", help="send frames as one stateful session")
+        else:
+            p.set_defaults(mode="multipart", batch_size=1, session_id=None)
+
+    p = sub.add_parser("compare")
+    p.add_argument("before")
+    p.add_argument("after")
+
+    args = parser.parse_args()
+    if args.target == "compare":
+        compare(args.before, args.after)
+        return
+
+    results = run(args)
+    print_results(results)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
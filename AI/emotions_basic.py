@@ -1,18 +1,15 @@
 import cv2
 import numpy as np
-from openvino.runtime import Core
+import ov_models
 
-# Path to the downloaded IR model files
-MODEL_XML = "intel/emotions-recognition-retail-0003/FP32/emotions-recognition-retail-0003.xml"
-MODEL_BIN = "intel/emotions-recognition-retail-0003/FP32/emotions-recognition-retail-0003.bin"
+# Directory of the downloaded IR model files (precision picked by OV_PRECISION)
+MODEL_DIR = "intel/emotions-recognition-retail-0003"
 
 # Emotion labels
 EMOTIONS = ["neutral", "happy", "sad", "surprise", "anger"]
 
 # Load OpenVINO model
-ie = Core()
-model = ie.read_model(model=MODEL_XML)
-compiled_model = ie.compile_model(model=model, device_name="CPU")
+compiled_model = ov_models.load_model(MODEL_DIR)
 input_layer = compiled_model.input(0)
 output_layer = compiled_model.output(0)
 
@@ -196,15 +196,13 @@ import numpy as np
 import time
 from keras.models import load_model
 from keras.preprocessing.image import img_to_array
-from openvino.runtime import Core
+import ov_models
 
 # === Load OpenVINO Emotion Model ===
 EMOTIONS = ["neutral", "happy", "sad", "surprise", "anger"]
-ov_model_xml = "intel/emotions-recognition-retail-0003/FP32/emotions-recognition-retail-0003.xml"
+ov_model_dir = "intel/emotions-recognition-retail-0003"
 
-ie = Core()
-ov_model = ie.read_model(model=ov_model_xml)
-ov_compiled_model = ie.compile_model(model=ov_model, device_name="CPU")
+ov_compiled_model = ov_models.load_model(ov_model_dir)
 ov_input_layer = ov_compiled_model.input(0)
 ov_output_layer = ov_compiled_model.output(0)
 
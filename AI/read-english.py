@@ -2,20 +2,19 @@ from skimage.filters.rank import entropy
 from skimage.morphology import disk
 import cv2
 import numpy as np
-from openvino.runtime import Core
+import ov_models
 from PIL import Image
 import os
 import json
+from ctc_decoding import ctc_greedy_decode
 
 # Paths
-model_xml = os.path.join("intel", "handwritten-english-recognition-0001", "FP32", "handwritten-english-recognition-0001.xml")
+model_dir = os.path.join("intel", "handwritten-english-recognition-0001")
 symbol_txt = os.path.join("intel", "handwritten-english-recognition-0001", "gnhk.txt")
 image_path = "handwritten-english-recognition-0001.jpg"
 
 # Load model
-ie = Core()
-model = ie.read_model(model=model_xml)
-compiled_model = ie.compile_model(model=model, device_name="CPU")
+compiled_model = ov_models.load_model(model_dir)
 output_layer = compiled_model.output(0)
 
 # Load symbol map from official text file as a string (for CTC decoding)
@@ -68,19 +67,12 @@ def preprocess_image(img):
     pad_img = np.expand_dims(pad_img, axis=0)
     return pad_img
 
-# Improved CTC greedy decoder matching demo logic
-# CTC blank is index 0, so symbol_map[1:] matches output indices 1+
+# CTC blank is index 0, so symbol_map[idx-1] is the symbol for output index idx > 0
+ctc_labels = [''] + list(symbol_map)
+
 def ctc_greedy_decoder(output):
-    output = np.squeeze(output)
-    pred_indices = np.argmax(output, axis=1)
-    decoded = []
-    prev = None
-    for idx in pred_indices:
-        if idx != prev and idx != 0:
-            # CTC blank is 0, so symbol_map[idx-1] for idx > 0
-            decoded.append(symbol_map[idx-1])
-        prev = idx
-    return ''.join(decoded)
+    # Model output is [T, 1, classes]; the shared decoder takes batch-first scores
+    return ctc_greedy_decode(np.transpose(output, (1, 0, 2)), ctc_labels, blank_index=0)[0]
 
 if __name__ == "__main__":
     if not os.path.exists(image_path):
@@ -1,107 +1,419 @@
 import numpy as np
 import sounddevice as sd
+import queue
+import threading
 import time
 import librosa
 import scipy
-from openvino.runtime import Core, PartialShape
-from textblob import TextBlob
+from openvino.runtime import PartialShape, Tensor
+import spelling
+from ctc_decoding import ctc_greedy_decode
+import ov_models
 
-MODEL_XML = "public/quartznet-15x5-en/FP16/quartznet-15x5-en.xml"
-NOISE_MODEL_XML = "intel/noise-suppression-poconetlike-0001/FP32/noise-suppression-poconetlike-0001.xml"
-DEVICE = "CPU"
+# IR precision and device come from ov_models (OV_PRECISION, OV_DEVICE, ...)
+MODEL_DIR = "public/quartznet-15x5-en"
+NOISE_MODEL_DIR = "intel/noise-suppression-poconetlike-0001"
 SAMPLE_RATE = 16000
-CHUNK_DURATION = 3  # seconds
-CHUNK_SIZE = SAMPLE_RATE * CHUNK_DURATION
+# Audio is recognized in overlapping windows: each window is HOP seconds of new
+# audio plus CONTEXT seconds either side, and only the CTC frames of the central
+# HOP are kept, so words on a window edge are decoded with context on both sides
+HOP_DURATION = 2.0  # seconds
+CONTEXT_DURATION = 0.5  # seconds
+HOP_SIZE = int(SAMPLE_RATE * HOP_DURATION)
+CONTEXT_SIZE = int(SAMPLE_RATE * CONTEXT_DURATION)
+WINDOW_SIZE = HOP_SIZE + 2 * CONTEXT_SIZE
+RING_SECONDS = 30
+MAX_PENDING_WINDOWS = 4
+OUTPUT_FRAME = 0.02  # seconds per QuartzNet output frame (10 ms mel hop, stride 2)
+# Queued after the last window of a speech segment, so the worker prints the word it held back
+END_OF_SPEECH = object()
+# QuartzNet log-mel features: 20 ms Hann window, 10 ms hop, 512-point FFT, 64 mels
+N_FFT = 512
+MEL_HOP = round(SAMPLE_RATE * 0.01)
+MEL_WIN = round(SAMPLE_RATE * 0.02)
+N_MELS = 64
+PREEMPH = 0.97
+# Per-channel normalization uses running statistics over about this many frames
+NORM_FRAMES = 1000
+HOP_FRAMES = HOP_SIZE // MEL_HOP
+CONTEXT_FRAMES = CONTEXT_SIZE // MEL_HOP
+WINDOW_FRAMES = WINDOW_SIZE // MEL_HOP
 ALPHABET = " abcdefghijklmnopqrstuvwxyz'~"  # ~ is blank symbol
 PAD_TO = 16
 POCO_PATCH_SIZE = 2048
+POCO_DELAY = 640  # samples the noise suppressor's output lags its input
+# Voice activity gate in front of denoising and recognition: a 20 ms frame is
+# speech when its energy is VAD_THRESHOLD_DB over the adaptive noise floor (and
+# over VAD_MIN_DB); speech is extended by a hangover after the last active frame
+# and a pre-roll before the first, and everything else is never processed
+VAD_FRAME = round(SAMPLE_RATE * 0.02)
+VAD_THRESHOLD_DB = 9.0
+VAD_MIN_DB = -55.0
+VAD_HANGOVER_FRAMES = 15
+VAD_PREROLL_FRAMES = 10
+VAD_FLOOR_RISE = 0.002  # per frame; the floor falls to quieter frames at once
+VAD_REPORT_SECONDS = 60
 BLANK_ID = len(ALPHABET) - 1
 
-def audio_to_melspectrum(audio, sampling_rate):
-    preemph = 0.97
-    preemphased = np.concatenate([audio[:1], audio[1:] - preemph * audio[:-1].astype(np.float32)])
-    win_length = round(sampling_rate * 0.02)
-    spec = np.abs(librosa.stft(preemphased, n_fft=512, hop_length=round(sampling_rate * 0.01),
-        win_length=win_length, center=True, window=scipy.signal.windows.hann(win_length), pad_mode='reflect'))
-    mel_basis = librosa.filters.mel(sr=sampling_rate, n_fft=512, n_mels=64, fmin=0.0, fmax=8000.0, norm='slaney', htk=False)
-    log_melspectrum = np.log(np.dot(mel_basis, np.power(spec, 2)) + 2 ** -24)
-    normalized = (log_melspectrum - log_melspectrum.mean(1)[:, None]) / (log_melspectrum.std(1)[:, None] + 1e-5)
-    remainder = normalized.shape[1] % PAD_TO
-    if remainder != 0:
-        normalized = np.pad(normalized, ((0, 0), (0, PAD_TO - remainder)))
-    return normalized[None]
-
-def ctc_greedy_decode(pred):
-    prev_id = BLANK_ID
-    transcription = []
-    for idx in pred[0].argmax(1):
-        if prev_id != idx != BLANK_ID:
-            transcription.append(ALPHABET[idx])
-        prev_id = idx
-    return ''.join(transcription)
-
-def suppress_noise(core, compiled_noise_model, chunk): #noise suppression using poconetlike model
-    input_size = POCO_PATCH_SIZE
-    inp_shapes = {name: obj.shape for obj in compiled_noise_model.inputs for name in obj.get_names()}
-    state_inp_names = [n for n in inp_shapes.keys() if "state" in n]
-    state_out_names = [n.replace('inp', 'out') for n in state_inp_names]
-    cleaned = []
-    res_states = {}
-    num_patches = int(np.ceil(len(chunk) / input_size))
-    for i in range(num_patches):
-        patch = chunk[i*input_size:(i+1)*input_size]
-        if len(patch) < input_size:
-            patch = np.pad(patch, (0, input_size - len(patch)), mode='constant')
-        inputs = {"input": patch[None, :].astype(np.float32)}
-        for n in state_inp_names:
-            if i == 0:
-                inputs[n] = np.zeros(inp_shapes[n], dtype=np.float32)
+class MelFrontend:
+    # Streaming log-mel features. The mel basis and the (zero-padded) Hann window
+    # are computed once; process() pre-emphasizes only the new samples and runs
+    # the STFT only for frames that became complete, appending log-mel frames to
+    # a ring. window() returns normalized [1, N_MELS, T] float32 input for
+    # QuartzNet, padded to a multiple of PAD_TO.
+
+    def __init__(self, ring_frames):
+        window = scipy.signal.windows.hann(MEL_WIN)
+        offset = (N_FFT - MEL_WIN) // 2
+        self.fft_window = np.zeros(N_FFT, dtype=np.float32)
+        self.fft_window[offset:offset + MEL_WIN] = window  # centered in the FFT frame, as librosa pads it
+        self.mel_basis = librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS, fmin=0.0, fmax=8000.0,
+                                             norm='slaney', htk=False).astype(np.float32)
+        self.frames = RingBuffer(ring_frames, (N_MELS,))
+        self.mean = np.zeros(N_MELS, dtype=np.float64)
+        self.square = np.ones(N_MELS, dtype=np.float64)
+        self.count = 0
+        # Frame k is centered on sample k * MEL_HOP, so the stream starts with N_FFT // 2 samples of silence
+        self.samples = np.zeros(N_FFT // 2, dtype=np.float32)
+        self.last_sample = 0.0
+
+    def process(self, audio):
+        # Feed new samples (float, -1..1); appends every frame they complete
+        if not len(audio):
+            return
+        audio = np.asarray(audio, dtype=np.float32) * 32767
+        preemphased = audio - PREEMPH * np.concatenate([[self.last_sample], audio[:-1]])
+        self.last_sample = audio[-1]
+        self.samples = np.concatenate([self.samples, preemphased.astype(np.float32)])
+        if len(self.samples) < N_FFT:
+            return
+        n = (len(self.samples) - N_FFT) // MEL_HOP + 1
+        framed = np.lib.stride_tricks.sliding_window_view(self.samples, N_FFT)[::MEL_HOP][:n]
+        power = np.abs(np.fft.rfft(framed * self.fft_window, axis=1)) ** 2
+        log_mel = np.log(power.astype(np.float32) @ self.mel_basis.T + 2 ** -24)  # [n, N_MELS]
+        self.samples = self.samples[n * MEL_HOP:]
+        self.update_stats(log_mel)
+        self.frames.write(log_mel)
+
+    def pad(self, n):
+        # Append n frames equal to the running mean, i.e. exactly 0 once
+        # normalized, instead of the log(2^-24) floor digital silence would give.
+        # The STFT restarts afterwards, as at the start of the stream.
+        self.frames.write(np.tile(self.mean.astype(np.float32), (n, 1)))
+        self.samples = np.zeros(N_FFT // 2, dtype=np.float32)
+        self.last_sample = 0.0
+
+    def update_stats(self, log_mel):
+        # Running per-channel mean and mean square: cumulative at first, then an
+        # exponential average over roughly NORM_FRAMES frames
+        n = len(log_mel)
+        weight = n / (min(self.count, NORM_FRAMES) + n)
+        self.mean += weight * (log_mel.mean(0) - self.mean)
+        self.square += weight * ((log_mel.astype(np.float64) ** 2).mean(0) - self.square)
+        self.count += n
+
+    def window(self, start, n):
+        features = self.frames.read(start, n)
+        std = np.sqrt(np.maximum(self.square - self.mean ** 2, 0))
+        normalized = ((features - self.mean) / (std + 1e-5)).T
+        remainder = normalized.shape[1] % PAD_TO
+        if remainder != 0:
+            normalized = np.pad(normalized, ((0, 0), (0, PAD_TO - remainder)))
+        return normalized[None].astype(np.float32)
+
+class Denoiser:
+    # Streaming wrapper around the PoCoNet-like noise suppressor. One infer
+    # request whose input and recurrent state tensors are bound to preallocated
+    # buffers; the state carries over from patch to patch and call to call, so
+    # the cleaned audio has no seams at chunk boundaries.
+
+    def __init__(self, compiled_model):
+        self.request = compiled_model.create_infer_request()
+        inputs = {name: port for port in compiled_model.inputs for name in port.get_names()}
+        self.state_names = [n for n in inputs if "state" in n]
+        self.patch = np.zeros((1, POCO_PATCH_SIZE), dtype=np.float32)
+        self.states = {n: np.zeros(tuple(inputs[n].shape), dtype=np.float32) for n in self.state_names}
+        self.request.set_tensor("input", Tensor(self.patch, shared_memory=True))
+        for n in self.state_names:
+            self.request.set_tensor(n, Tensor(self.states[n], shared_memory=True))
+        self.output_port = compiled_model.output("output")
+        self.state_ports = {n: compiled_model.output(n.replace('inp', 'out')) for n in self.state_names}
+        self.reset()
+
+    def reset(self):
+        for state in self.states.values():
+            state.fill(0)
+        self.filled = 0
+        self.skip = POCO_DELAY
+        self.outstanding = 0  # samples fed in but not returned yet
+
+    def process(self, samples):
+        # Feed any number of samples; returns the cleaned samples that are ready,
+        # aligned with the input (the model's POCO_DELAY lag is dropped once, at the start)
+        cleaned = []
+        samples = np.asarray(samples, dtype=np.float32)
+        self.outstanding += len(samples)
+        while len(samples):
+            take = min(POCO_PATCH_SIZE - self.filled, len(samples))
+            self.patch[0, self.filled:self.filled + take] = samples[:take]
+            self.filled += take
+            samples = samples[take:]
+            if self.filled == POCO_PATCH_SIZE:
+                self.request.infer()
+                cleaned.append(self.request.get_tensor(self.output_port).data[0].copy())
+                for n, port in self.state_ports.items():
+                    self.states[n][...] = self.request.get_tensor(port).data
+                self.filled = 0
+        if not cleaned:
+            return np.zeros(0, dtype=np.float32)
+        cleaned = np.concatenate(cleaned)
+        skip = min(self.skip, len(cleaned))
+        self.skip -= skip
+        self.outstanding -= len(cleaned) - skip
+        return cleaned[skip:]
+
+    def flush(self):
+        # Push the buffered tail (and the delayed samples) out with trailing silence
+        need = self.outstanding
+        cleaned = []
+        while sum(len(c) for c in cleaned) < need:
+            cleaned.append(self.process(np.zeros(POCO_PATCH_SIZE - self.filled, dtype=np.float32)))
+        self.reset()
+        return np.concatenate(cleaned)[:need] if cleaned else np.zeros(0, dtype=np.float32)
+
+class EnergyVAD:
+    # Frame energy against a noise floor that tracks quiet frames quickly and
+    # louder background slowly, with hangover so pauses between words stay speech
+
+    def __init__(self):
+        self.noise_db = None
+        self.hangover = 0
+        self.frames = 0
+        self.speech_frames = 0
+
+    def process(self, frames):
+        # frames: [n, VAD_FRAME] samples -> speech decision per frame
+        energy_db = 10 * np.log10(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-12)
+        decisions = np.zeros(len(frames), dtype=bool)
+        for i, energy in enumerate(energy_db):
+            if self.noise_db is None or energy < self.noise_db:
+                self.noise_db = energy
             else:
-                inputs[n] = res_states[n]
-        result = compiled_noise_model(inputs)
-        cleaned_patch = result[compiled_noise_model.output("output")].squeeze(0)
-        cleaned.append(cleaned_patch)
-        for n in state_inp_names:
-            res_states[n] = result[compiled_noise_model.output(n.replace('inp', 'out'))]
-    cleaned_audio = np.concatenate(cleaned)
-    cleaned_audio = cleaned_audio[640:len(chunk)+640]
-    return cleaned_audio
+                self.noise_db += VAD_FLOOR_RISE * (energy - self.noise_db)
+            if energy > max(self.noise_db + VAD_THRESHOLD_DB, VAD_MIN_DB):
+                self.hangover = VAD_HANGOVER_FRAMES
+                decisions[i] = True
+            elif self.hangover > 0:
+                self.hangover -= 1
+                decisions[i] = True
+        self.frames += len(frames)
+        self.speech_frames += int(decisions.sum())
+        return decisions
+
+    def skipped_fraction(self):
+        return 1 - self.speech_frames / self.frames if self.frames else 0.0
+
+class RingBuffer:
+    # Single-producer / single-consumer ring of samples (or of feature frames,
+    # with `item_shape`). The writer only writes and then advances `written`; the
+    # reader only reads behind it, so neither side needs a lock.
+
+    def __init__(self, capacity, item_shape=()):
+        self.buffer = np.zeros((capacity,) + item_shape, dtype=np.float32)
+        self.capacity = capacity
+        self.written = 0  # total items ever written
+
+    def write(self, samples):
+        total = len(samples)
+        # More than fits: only the newest `capacity` items are kept, at the
+        # positions they have in the stream
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        start = (self.written + total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:n - first] = samples[first:]
+        self.written += total
+
+    def read(self, start, n):
+        # Items [start, start + n) of the stream; positions before 0 read as zeros
+        out = np.zeros((n,) + self.buffer.shape[1:], dtype=np.float32)
+        skip = max(0, -start)
+        start += skip
+        if skip >= n:
+            return out
+        begin = start % self.capacity
+        first = min(n - skip, self.capacity - begin)
+        out[skip:skip + first] = self.buffer[begin:begin + first]
+        out[skip + first:] = self.buffer[:n - skip - first]
+        return out
+
+def central_frames(num_frames):
+    # Output frames of a window that belong to its central HOP
+    first = int(round(CONTEXT_DURATION / OUTPUT_FRAME))
+    last = int(round((CONTEXT_DURATION + HOP_DURATION) / OUTPUT_FRAME))
+    return first, min(last, num_frames)
+
+def drop_oldest_window(windows):
+    # Makes room in a full queue by discarding its oldest window. END_OF_SPEECH
+    # markers are never dropped: the held-back word would then leak into the
+    # next utterance instead of being flushed with its own.
+    with windows.mutex:
+        for i, item in enumerate(windows.queue):
+            if item is not END_OF_SPEECH:
+                del windows.queue[i]
+                return True
+    return False
+
+def print_transcript(text):
+    text = text.strip()
+    if text:
+        print(f"Raw: {text} | Corrected: {spelling.correct(text)}", flush=True)
+
+def recognize_windows(windows, compiled_model, output_layer):
+    # Worker thread: transcribe each window's central region and print complete
+    # words. The text after the last space may be a word that carries on into
+    # the next window, so it is held back and prefixed to the next window's text
+    # until a space (or the end of the speech segment) closes it.
+    previous = None  # last emitted output frame, to collapse repeats across windows
+    pending = ""
+    while True:
+        melspec = windows.get()
+        if melspec is None:
+            print_transcript(pending)
+            return
+        if melspec is END_OF_SPEECH:
+            print_transcript(pending)
+            pending, previous = "", None
+            continue
+        result = compiled_model([melspec])[output_layer][0]  # [T, C]
+        first, last = central_frames(result.shape[0])
+        frames = result[first:last]
+        if previous is not None:
+            # Decode with the previous window's last frame in front so a character
+            # spanning the boundary isn't emitted twice, then drop that frame's text
+            text = ctc_greedy_decode(np.concatenate([previous[None], frames]), ALPHABET, BLANK_ID)[0]
+            if previous.argmax() != BLANK_ID:
+                text = text[1:]
+        else:
+            text = ctc_greedy_decode(frames, ALPHABET, BLANK_ID)[0]
+        if len(frames):
+            previous = frames[-1]
+        text = pending + text
+        cut = text.rfind(" ")
+        if cut < 0:
+            pending = text
+            continue
+        print_transcript(text[:cut])
+        pending = text[cut + 1:]
 
 def main():
     print(sd.query_devices())
     print("Loading models...")
-    core = Core()
-    dummy_audio = np.zeros((1, 64, CHUNK_SIZE // 10), dtype=np.float32)
-    model = core.read_model(MODEL_XML)
+    model = ov_models.read_model(MODEL_DIR)
     input_layer = model.input(0)
     shape = input_layer.partial_shape
     shape[2] = -1
     model.reshape({input_layer: PartialShape(shape)})
-    compiled_model = core.compile_model(model, DEVICE)
+    compiled_model = ov_models.compile_model(model)
     output_layer = compiled_model.output(0)
-    noise_model = core.read_model(NOISE_MODEL_XML)
-    compiled_noise_model = core.compile_model(noise_model, DEVICE)
+    compiled_noise_model = ov_models.load_model(NOISE_MODEL_DIR)
+    spelling.get_index()
+
+    # Capture: the sounddevice callback only copies samples into the ring.
+    # New audio goes through the VAD here; only speech is denoised and turned
+    # into mel frames, so recognition runs on speech time, not wall time.
+    # Windows of frames are recognized on a worker thread; if it falls behind,
+    # the oldest pending window is dropped rather than letting latency grow.
+    ring = RingBuffer(SAMPLE_RATE * RING_SECONDS)
+    frontend = MelFrontend(RING_SECONDS * SAMPLE_RATE // MEL_HOP)
+    denoiser = Denoiser(compiled_noise_model)
+    vad = EnergyVAD()
+    windows = queue.Queue(maxsize=MAX_PENDING_WINDOWS)
+    worker = threading.Thread(target=recognize_windows, daemon=True,
+                              args=(windows, compiled_model, output_layer))
+    worker.start()
+
+    def on_audio(indata, frames, time_info, status):
+        if status:
+            print(f"Audio status: {status}", flush=True)
+        ring.write(indata[:, 0])
 
     print("Listening... (Press Ctrl+C to stop)")
-    stream = sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype='float32')
+    stream = sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype='float32', callback=on_audio)
     stream.start()
+    raw_read = 0  # samples of the raw ring already through the VAD
+    speech_start = None  # raw sample where the current speech run began
+    fed = 0  # raw samples up to here have been denoised
+    hop_start = 0  # first mel frame of the next window's central region
+    flush_at = None  # once hop_start reaches this, the speech segment's last window is queued
+    last_report = time.monotonic()
+
+    def feed(start, end):
+        nonlocal fed
+        start = max(start, fed, ring.written - ring.capacity)
+        if end > start:
+            frontend.process(denoiser.process(ring.read(start, end - start)))
+        fed = max(fed, end)
+
+    def end_of_speech():
+        # Drain the denoiser and pad with neutral frames up to the end of the window
+        # holding the last speech frame, so the last words are recognized now
+        # rather than at the next speech
+        nonlocal flush_at
+        frontend.process(denoiser.flush())
+        hops = max(0, -(-(frontend.frames.written - hop_start) // HOP_FRAMES))
+        flush_at = hop_start + hops * HOP_FRAMES
+        missing = flush_at + CONTEXT_FRAMES - frontend.frames.written
+        if missing > 0:
+            frontend.pad(missing)
+
     try:
         while True:
-            data, _ = stream.read(CHUNK_SIZE)
-            chunk = data.flatten()
-            cleaned_chunk = suppress_noise(core, compiled_noise_model, chunk)
-            chunk_int16 = (cleaned_chunk * 32767).astype(np.int16)
-            melspec = audio_to_melspectrum(chunk_int16, SAMPLE_RATE).astype(np.float32)
-            result = compiled_model([melspec])[output_layer]
-            text = ctc_greedy_decode(result)
-            corrected_text = str(TextBlob(text).correct())
-            print(f"Raw: {text} | Corrected: {corrected_text}")
-            time.sleep(0.1)
+            if ring.written - raw_read > ring.capacity:
+                # Fell a whole ring behind; skip to the newest audio
+                raw_read = ring.written - ring.capacity
+            count = (ring.written - raw_read) // VAD_FRAME
+            if count:
+                decisions = vad.process(ring.read(raw_read, count * VAD_FRAME).reshape(count, VAD_FRAME))
+                for i, speech in enumerate(decisions):
+                    frame_start = raw_read + i * VAD_FRAME
+                    if speech and speech_start is None:
+                        speech_start = frame_start - VAD_PREROLL_FRAMES * VAD_FRAME
+                    elif not speech and speech_start is not None:
+                        feed(speech_start, frame_start)
+                        end_of_speech()
+                        speech_start = None
+                raw_read += count * VAD_FRAME
+                if speech_start is not None:
+                    feed(speech_start, raw_read)
+                    speech_start = raw_read
+            if time.monotonic() - last_report > VAD_REPORT_SECONDS:
+                print(f"VAD: skipped {vad.skipped_fraction():.0%} of audio", flush=True)
+                last_report = time.monotonic()
+            if flush_at is not None and hop_start >= flush_at:
+                windows.put(END_OF_SPEECH)
+                flush_at = None
+            frames = frontend.frames
+            if frames.written < hop_start + HOP_FRAMES + CONTEXT_FRAMES:
+                time.sleep(0.05)
+                continue
+            if frames.written - (hop_start - CONTEXT_FRAMES) > frames.capacity:
+                hop_start = frames.written - HOP_FRAMES - CONTEXT_FRAMES
+            window = frontend.window(hop_start - CONTEXT_FRAMES, WINDOW_FRAMES)
+            hop_start += HOP_FRAMES
+            try:
+                windows.put_nowait(window)
+            except queue.Full:
+                if drop_oldest_window(windows):
+                    print("Recognition is behind, dropped a window", flush=True)
+                windows.put(window)
     except KeyboardInterrupt:
-        print("Stopped.")
+        print(f"Stopped. VAD skipped {vad.skipped_fraction():.0%} of audio.")
     finally:
         stream.stop()
         stream.close()
+        windows.put(None)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,9 +1,10 @@
 import speech_recognition as sr
-from textblob import TextBlob
+import spelling
 
 def main():
     recognizer = sr.Recognizer()
     mic = sr.Microphone()
+    spelling.get_index()
     print("Listening... (Press Ctrl+C to stop)")
     try:
         while True:
@@ -13,7 +14,7 @@ def main():
                 audio = recognizer.listen(source)
             try:
                 text = recognizer.recognize_google(audio)
-                corrected_text = str(TextBlob(text).correct())
+                corrected_text = spelling.correct(text)
                 print(f"Raw: {text} | Corrected: {corrected_text}")
             except sr.UnknownValueError:
                 print("Could not understand audio.")
@@ -0,0 +1,227 @@
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+# Spelling correction for transcripts, in place of TextBlob(text).correct().
+#
+# Same idea as TextBlob's corrector (the most frequent known word within two
+# edits wins, a known word is left alone) but looked up through a symmetric-
+# delete index instead of generating and testing every edit of every word:
+# each dictionary word is stored under every string reachable from it by up to
+# MAX_DISTANCE deletions, so the candidates for a word are the dictionary words
+# sharing one of its own deletions. The index is a handful of flat numpy arrays
+# (sorted 64-bit hashes of the deletions, word ids, UTF-8 word blob, counts) that
+# can be saved to a directory and memory-mapped back.
+#
+#   SPELLING_WORDS       "word count" list (default: TextBlob's en-spelling.txt)
+#   SPELLING_VOCAB       optional domain vocabulary, one word (optionally "word count") per line;
+#                        words without a count rank with the most frequent dictionary word
+#   SPELLING_INDEX_DIR   where the built index is cached and mmap-loaded from (empty: build in memory)
+
+MAX_DISTANCE = 2
+SPELLING_WORDS = os.environ.get("SPELLING_WORDS", "")
+SPELLING_VOCAB = os.environ.get("SPELLING_VOCAB", "")
+SPELLING_INDEX_DIR = os.environ.get("SPELLING_INDEX_DIR", "")
+
+WORD_RE = re.compile(r"[A-Za-z']+")
+INDEX_FILES = ("keys", "ids", "blob", "offsets", "counts")
+
+def textblob_words_path():
+    spec = importlib.util.find_spec("textblob")
+    if spec is None or spec.origin is None:
+        raise FileNotFoundError("TextBlob is not installed; set SPELLING_WORDS to a word list")
+    return os.path.join(os.path.dirname(spec.origin), "en", "en-spelling.txt")
+
+def read_word_counts(path, default_count=None):
+    counts = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(";;;"):
+                continue
+            parts = line.split()
+            if not parts:
+                continue
+            word = parts[0].lower()
+            count = int(parts[1]) if len(parts) > 1 else default_count
+            counts[word] = max(counts.get(word, 0), count or 1)
+    return counts
+
+def string_hash(text):
+    # Stable across processes (unlike hash()), so saved indexes stay valid
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+def deletes(word, max_distance=MAX_DISTANCE):
+    # Every string reachable from `word` by up to max_distance deletions, itself included
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - found
+        found |= frontier
+    return found
+
+def edit_distance(a, b, limit):
+    # Optimal string alignment distance (adjacent transpositions count as one
+    # edit), giving up with limit + 1 once every alignment is over the limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+class SpellingIndex:
+    def __init__(self, keys, ids, blob, offsets, counts, max_distance=MAX_DISTANCE):
+        self.keys = keys          # uint64, sorted hashes of every deletion
+        self.ids = ids            # int32, word id for each key
+        self.blob = blob          # uint8, UTF-8 words back to back
+        self.offsets = offsets    # int64, word i is blob[offsets[i]:offsets[i + 1]]
+        self.counts = counts      # int64, frequency of each word
+        self.max_distance = max_distance
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+
+    @classmethod
+    def build(cls, word_counts, max_distance=MAX_DISTANCE):
+        words = sorted(word_counts)
+        encoded = [w.encode("utf-8") for w in words]
+        offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        counts = np.array([word_counts[w] for w in words], dtype=np.int64)
+        keys, ids = [], []
+        for word_id, word in enumerate(words):
+            for d in deletes(word, max_distance):
+                keys.append(string_hash(d))
+                ids.append(word_id)
+        keys = np.array(keys, dtype=np.uint64)
+        ids = np.array(ids, dtype=np.int32)
+        order = np.argsort(keys, kind="stable")
+        return cls(keys[order], ids[order], blob, offsets, counts, max_distance)
+
+    def save(self, directory, meta=None):
+        os.makedirs(directory, exist_ok=True)
+        for name in INDEX_FILES:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(meta or {}, max_distance=self.max_distance), f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                  for name in INDEX_FILES]
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(*arrays, max_distance=meta["max_distance"])
+
+    def word(self, word_id):
+        return bytes(self.blob[self.offsets[word_id]:self.offsets[word_id + 1]]).decode("utf-8")
+
+    def candidates(self, word, max_distance):
+        # Ids of dictionary words sharing a deletion (of up to max_distance) with `word`
+        hashes = np.array([string_hash(d) for d in deletes(word, max_distance)], dtype=np.uint64)
+        lo = np.searchsorted(self.keys, hashes, side="left")
+        hi = np.searchsorted(self.keys, hashes, side="right")
+        found = [self.ids[l:h] for l, h in zip(lo, hi) if h > l]
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int32)
+
+    def correct_word(self, word):
+        # Lowercase word -> the most frequent known word at the smallest edit distance
+        # (the word itself when it is known, unchanged when nothing is within reach)
+        with self.cache_lock:
+            if word in self.cache:
+                return self.cache[word]
+        best = self.lookup(word)
+        with self.cache_lock:
+            if len(self.cache) > 100000:
+                self.cache.clear()
+            self.cache[word] = best
+        return best
+
+    def lookup(self, word):
+        # Widen the search one edit at a time, as any word at distance d shares a
+        # deletion of at most d with it: known words cost a single hash lookup and
+        # most typos are settled before the larger distance-2 candidate set
+        for max_distance in range(self.max_distance + 1):
+            best, best_count = None, -1
+            for word_id in self.candidates(word, max_distance):
+                if self.counts[word_id] <= best_count:
+                    continue
+                candidate = self.word(word_id)
+                if edit_distance(word, candidate, max_distance) <= max_distance:
+                    best, best_count = candidate, self.counts[word_id]
+            if best is not None:
+                return best
+        return word
+
+    def correct(self, text):
+        # Corrects every alphabetic word in `text`, keeping everything else and
+        # the word's capitalization as they were
+        def replace(match):
+            word = match.group(0)
+            corrected = self.correct_word(word.lower())
+            if word.isupper() and len(word) > 1:
+                return corrected.upper()
+            if word[0].isupper():
+                return corrected[:1].upper() + corrected[1:]
+            return corrected
+        return WORD_RE.sub(replace, text)
+
+def source_meta(words_path, vocab_path):
+    # Identifies the inputs a cached index was built from
+    meta = {}
+    for name, path in (("words", words_path), ("vocab", vocab_path)):
+        if path:
+            meta[name] = {"path": os.path.abspath(path), "mtime": os.path.getmtime(path)}
+    return meta
+
+def load_index(words_path=None, vocab_path=None, index_dir=None):
+    words_path = words_path or SPELLING_WORDS or textblob_words_path()
+    vocab_path = vocab_path if vocab_path is not None else SPELLING_VOCAB
+    index_dir = index_dir if index_dir is not None else SPELLING_INDEX_DIR
+    meta = source_meta(words_path, vocab_path)
+
+    if index_dir and os.path.exists(os.path.join(index_dir, "meta.json")):
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("sources") == meta and saved.get("max_distance") == MAX_DISTANCE:
+            return SpellingIndex.load(index_dir)
+        print(f"Spelling index in {index_dir} is out of date, rebuilding")
+
+    word_counts = read_word_counts(words_path)
+    if vocab_path:
+        top = max(word_counts.values(), default=1)
+        for word, count in read_word_counts(vocab_path, default_count=top).items():
+            word_counts[word] = max(word_counts.get(word, 0), count)
+    index = SpellingIndex.build(word_counts)
+    if index_dir:
+        index.save(index_dir, {"sources": meta})
+        # Reload so this process uses the memory-mapped copy too
+        return SpellingIndex.load(index_dir)
+    return index
+
+default_index = None
+default_index_lock = threading.Lock()
+
+def get_index():
+    global default_index
+    with default_index_lock:
+        if default_index is None:
+            default_index = load_index()
+        return default_index
+
+def correct(text):
+    return get_index().correct(text)